@@ -0,0 +1,109 @@
+import argparse
+import timeit
+
+import numpy as np
+
+from sujip.data import DataFrame, Field, Row
+from sujip.data.dataframe import CollateStep, collate_pad, collate_pad_1d
+
+
+def make_dataframe(n_fields):
+    fields = {}
+
+    for i in range(n_fields):
+        if i % 3 == 0:
+            fields[f'field{i}'] = Field(pad=True)
+
+        elif i % 3 == 1:
+            fields[f'field{i}'] = Field(listify=True)
+
+        else:
+            fields[f'field{i}'] = Field()
+
+    return DataFrame(**fields)
+
+
+def make_batch(n_fields, batch_size, rng):
+    batch = []
+
+    for _ in range(batch_size):
+        row = {}
+
+        for i in range(n_fields):
+            if i % 3 == 0:
+                row[f'field{i}'] = rng.integers(0, 100, rng.integers(4, 16))
+
+            elif i % 3 == 1:
+                row[f'field{i}'] = 'text'
+
+            else:
+                row[f'field{i}'] = rng.random(4, dtype=np.float32)
+
+        batch.append(Row(**row))
+
+    return batch
+
+
+def bench_plan(n_fields, batch_size, repeat):
+    rng = np.random.default_rng(0)
+    dset = make_dataframe(n_fields)
+    batch = make_batch(n_fields, batch_size, rng)
+
+    dynamic = dset.collate_fn(compile=False)
+    compiled = dset.collate_fn()
+    compiled(batch)
+
+    dynamic_time = min(timeit.repeat(lambda: dynamic(batch), number=repeat, repeat=3))
+    compiled_time = min(timeit.repeat(lambda: compiled(batch), number=repeat, repeat=3))
+
+    print(
+        f'plan fields={n_fields:3d} batch={batch_size:4d} '
+        f'dynamic={dynamic_time / repeat * 1e6:9.1f}us '
+        f'compiled={compiled_time / repeat * 1e6:9.1f}us '
+        f'speedup={dynamic_time / compiled_time:5.2f}x'
+    )
+
+
+def bench_pad_1d(batch_size, repeat):
+    rng = np.random.default_rng(0)
+    values = [
+        rng.integers(0, 100, rng.integers(16, 512)).tolist() for _ in range(batch_size)
+    ]
+    step = CollateStep('text', 'text', Field(pad=True))
+    step.bind(values[0])
+    results = {}
+
+    loop_time = min(
+        timeit.repeat(
+            lambda: collate_pad(step, values, results), number=repeat, repeat=3
+        )
+    )
+    vector_time = min(
+        timeit.repeat(
+            lambda: collate_pad_1d(step, values, results), number=repeat, repeat=3
+        )
+    )
+
+    print(
+        f'pad_1d batch={batch_size:4d} '
+        f'loop={loop_time / repeat * 1e6:9.1f}us '
+        f'vectorized={vector_time / repeat * 1e6:9.1f}us '
+        f'speedup={loop_time / vector_time:5.2f}x'
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--batch', type=int, default=32)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    for n_fields in (10, 20, 50):
+        bench_plan(n_fields, args.batch, args.repeat)
+
+    for batch_size in (32, 256, 1024, 4096):
+        bench_pad_1d(batch_size, max(args.repeat * 32 // batch_size, 1))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+import argparse
+import timeit
+
+import torch
+
+from sujip.optim import AdamW, LAMB, QHAdam
+
+
+def make_params(n, size):
+    params = [torch.nn.Parameter(torch.randn(size)) for _ in range(n)]
+
+    for p in params:
+        p.grad = torch.randn_like(p)
+
+    return params
+
+
+def bench_step(optim_cls, n_params, size, steps):
+    times = {}
+
+    for mode in ('per-parameter', 'foreach', 'flat'):
+        optimizer = optim_cls(
+            make_params(n_params, size),
+            foreach=mode == 'foreach',
+            flat=mode == 'flat',
+        )
+        optimizer.step()
+        times[mode] = timeit.timeit(optimizer.step, number=steps) / steps
+
+    print(
+        f'{optim_cls.__name__:8s} params={n_params:5d} '
+        + ' '.join(f'{mode}={time * 1e3:.3f}ms' for mode, time in times.items())
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--size', type=int, default=1024)
+    parser.add_argument('--steps', type=int, default=50)
+    args = parser.parse_args()
+
+    for optim_cls in (AdamW, LAMB, QHAdam):
+        for n_params in (10, 100, 1000, 5000):
+            # Larger counts take fewer steps, so the sweep stays short
+            steps = min(max(args.steps * 100 // n_params, 1), args.steps)
+            bench_step(optim_cls, n_params, args.size, steps)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+import argparse
+import timeit
+import tracemalloc
+
+from sujip.data import DataFrame, Field, Row
+
+
+def measure(make, n):
+    tracemalloc.start()
+    rows = [make(i) for i in range(n)]
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return rows, size / n
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--n', type=int, default=100000)
+    parser.add_argument('--fields', type=int, default=8)
+    args = parser.parse_args()
+
+    names = [f'field{i}' for i in range(args.fields)]
+    dset = DataFrame(**{name: Field() for name in names})
+    Sample = dset.row_type()
+
+    rows, row_bytes = measure(lambda i: Row(**{name: i for name in names}), args.n)
+    records, record_bytes = measure(
+        lambda i: Sample(**{name: i for name in names}), args.n
+    )
+
+    print(
+        f'memory per sample: Row={row_bytes:.0f}B record={record_bytes:.0f}B '
+        f'ratio={row_bytes / record_bytes:.2f}x'
+    )
+
+    last = args.fields - 1
+
+    for label, key in (('named', names[last]), ('positional', last)):
+        row_time = timeit.timeit(lambda: rows[0][key], number=100000)
+        record_time = timeit.timeit(lambda: records[0][key], number=100000)
+
+        print(
+            f'{label:10s} access: Row={row_time * 10:.3f}us '
+            f'record={record_time * 10:.3f}us'
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+import argparse
+import time
+
+import torch
+
+from sujip.optim import Updater
+
+
+def make_model(layers, dim):
+    torch.manual_seed(0)
+
+    return torch.nn.Sequential(*[torch.nn.Linear(dim, dim) for _ in range(layers)])
+
+
+def measure(model, updater, inputs, steps):
+    def run():
+        updater.backward(model(inputs).square().mean())
+        updater.step()
+
+    run()
+    start = time.perf_counter()
+
+    for _ in range(steps):
+        run()
+
+    step_time = (time.perf_counter() - start) / steps
+
+    start = time.perf_counter()
+
+    for _ in range(steps):
+        updater.zero_grad()
+
+    return step_time, (time.perf_counter() - start) / steps
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--layers', type=int, default=16)
+    parser.add_argument('--dim', type=int, default=1024)
+    parser.add_argument('--batch', type=int, default=8)
+    parser.add_argument('--steps', type=int, default=20)
+    parser.add_argument('--bucket_size', type=int, default=2**24)
+    args = parser.parse_args()
+
+    inputs = torch.randn(args.batch, args.dim)
+    modes = {
+        'zeros': {'set_to_none': False},
+        'set_to_none': {'set_to_none': True},
+        'bucket': {'bucket_size': args.bucket_size},
+    }
+
+    for mode, kwargs in modes.items():
+        model = make_model(args.layers, args.dim)
+        optimizer = torch.optim.SGD(model.parameters(), lr=1e-3)
+        updater = Updater(None, optimizer, **kwargs)
+        step_time, zero_time = measure(model, updater, inputs, args.steps)
+
+        print(
+            f'{mode:12s} step={step_time * 1e3:.3f}ms '
+            f'zero_grad={zero_time * 1e3:.3f}ms'
+        )
+
+
+if __name__ == '__main__':
+    main()
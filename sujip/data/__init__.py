@@ -1 +1,14 @@
-from .dataframe import Field, Row, Derived, Batch, DataFrame
+from .dataframe import Field, Row, Derived, Batch, DataFrame, Columns, Ragged
+from .buffer import BufferPool
+from .sampler import (
+    BucketBatchSampler,
+    TokenBudgetBatchSampler,
+    padding_efficiency,
+)
+from .prefetch import Prefetcher
+from .transport import SharedMemoryTransport, SharedBatch
+from .columnar import ColumnarWriter, ColumnarDataset
+from .cache import DerivedCache
+from .record import Record, RowRecord, BatchRecord, record_type
+from .stream import ShardedStream
+from .profiler import CollateProfiler
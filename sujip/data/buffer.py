@@ -0,0 +1,78 @@
+import numpy as np
+import torch
+
+
+def torch_dtype(dtype):
+    return torch.from_numpy(np.empty(0, dtype=dtype)).dtype
+
+
+def collate_dtype(dtype):
+    if dtype == np.float64:
+        return np.dtype(np.float32)
+
+    return dtype
+
+
+class BufferPool:
+    # Reuses flat, optionally pinned tensors for padded outputs. Buffers are
+    # keyed by field, dtype and element count rounded up to a power of two, and
+    # every key keeps a ring of `depth` buffers, so a returned tensor is only
+    # overwritten after `depth` later batches with the same key. Keep depth
+    # larger than the number of batches alive at once, including batches that
+    # are still being copied to the device with non_blocking=True.
+    #
+    # Pools only work in the process that consumes the batches. Tensors sent
+    # from DataLoader workers are moved to shared memory, so later writes to
+    # a reused buffer show up in batches the consumer still holds, and
+    # pinning is lost on the way. Use SharedMemoryTransport for workers.
+
+    def __init__(self, pin_memory=False, depth=2):
+        self.pin_memory = pin_memory
+        self.depth = depth
+        self.buffers = {}
+        self.cursors = {}
+
+    def get(self, key, dtype, shape):
+        if torch.utils.data.get_worker_info() is not None:
+            raise RuntimeError(
+                'BufferPool cannot be used inside DataLoader workers, as its '
+                'buffers would be shared with batches still in use; collate in '
+                'the main process or use SharedMemoryTransport'
+            )
+
+        numel = 1
+        for size in shape:
+            numel *= size
+
+        bucket = 1 << max(numel - 1, 0).bit_length()
+        key = key, np.dtype(dtype), bucket
+        ring = self.buffers.get(key)
+
+        if ring is None:
+            ring = [
+                torch.empty(
+                    bucket, dtype=torch_dtype(dtype), pin_memory=self.pin_memory
+                )
+                for _ in range(self.depth)
+            ]
+            self.buffers[key] = ring
+            self.cursors[key] = 0
+
+        cursor = self.cursors[key]
+        self.cursors[key] = (cursor + 1) % self.depth
+
+        return ring[cursor][:numel].view(shape)
+
+    def clear(self):
+        self.buffers.clear()
+        self.cursors.clear()
+
+    @property
+    def nbytes(self):
+        total = 0
+
+        for ring in self.buffers.values():
+            for buffer in ring:
+                total += buffer.numel() * buffer.element_size()
+
+        return total
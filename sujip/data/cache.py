@@ -0,0 +1,149 @@
+import hashlib
+import os
+import pickle
+import tempfile
+from collections import OrderedDict, abc
+
+import numpy as np
+import torch
+
+
+def content_hash(sample, keys=None):
+    if keys is not None:
+        items = [(k, sample[k]) for k in keys]
+
+    elif isinstance(sample, abc.Mapping):
+        items = list(sample.items())
+
+    else:
+        items = list(enumerate(sample))
+
+    digest = hashlib.sha1()
+
+    for key, value in items:
+        digest.update(repr(key).encode())
+
+        if isinstance(value, torch.Tensor):
+            value = value.detach().cpu().numpy()
+
+        if isinstance(value, np.ndarray):
+            digest.update(f'{value.dtype.str}{value.shape}'.encode())
+            digest.update(np.ascontiguousarray(value).data)
+
+        else:
+            digest.update(pickle.dumps(value))
+
+    return digest.hexdigest()
+
+
+def value_nbytes(value):
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+
+    if isinstance(value, torch.Tensor):
+        return value.numel() * value.element_size()
+
+    if isinstance(value, (list, tuple)):
+        return sum(value_nbytes(v) for v in value)
+
+    return 64
+
+
+class DerivedCache:
+    # LRU cache of derived values bounded by the number of entries and an
+    # estimate of their bytes. With cache_dir every computed value is also
+    # written to disk, which lets DataLoader workers share results; entries
+    # evicted from memory are read back from there.
+
+    def __init__(self, max_items=None, max_bytes=None, cache_dir=None):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+
+        self.entries = OrderedDict()
+        self.nbytes = 0
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def path(self, key):
+        name = hashlib.sha1(repr(key).encode()).hexdigest()
+
+        return os.path.join(self.cache_dir, name + '.pkl')
+
+    def get(self, key):
+        entry = self.entries.get(key)
+
+        if entry is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+
+            return True, entry[0]
+
+        if self.cache_dir is not None:
+            path = self.path(key)
+
+            if os.path.exists(path):
+                with open(path, 'rb') as f:
+                    value = pickle.load(f)
+
+                self.disk_hits += 1
+                self.insert(key, value)
+
+                return True, value
+
+        self.misses += 1
+
+        return False, None
+
+    def put(self, key, value):
+        self.insert(key, value)
+
+        if self.cache_dir is not None:
+            path = self.path(key)
+
+            if not os.path.exists(path):
+                # Written to a temporary file first so that other workers
+                # never read a partial file.
+                fd, tmp = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+
+                with os.fdopen(fd, 'wb') as f:
+                    pickle.dump(value, f)
+
+                os.replace(tmp, path)
+
+    def insert(self, key, value):
+        size = value_nbytes(value)
+
+        if key in self.entries:
+            self.nbytes -= self.entries.pop(key)[1]
+
+        self.entries[key] = value, size
+        self.nbytes += size
+
+        while self.entries and (
+            (self.max_items is not None and len(self.entries) > self.max_items)
+            or (self.max_bytes is not None and self.nbytes > self.max_bytes)
+        ):
+            _, (_, size) = self.entries.popitem(last=False)
+            self.nbytes -= size
+            self.evictions += 1
+
+    def clear(self):
+        self.entries.clear()
+        self.nbytes = 0
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'items': len(self.entries),
+            'bytes': self.nbytes,
+        }
@@ -0,0 +1,220 @@
+import json
+import os
+import pickle
+from collections import OrderedDict
+
+import numpy as np
+from torch.utils.data import Dataset
+
+from .dataframe import Columns, Derived, Ragged, Row, convert2numpy, is_named
+
+# A columnar dataset is a directory with one raw binary file per non-derived
+# field of a DataFrame and a meta.json that describes them. Fields that have
+# the same shape in every sample are stored as a single (length, *shape) array,
+# so scalars keep their shape (). pad and pack fields are ragged: their samples
+# are stored back to back and <name>.offset.npy / <name>.shape.npy hold the
+# element offset and the shape of every sample. listify fields are collated as
+# lists of the original values, so they are pickled back to back with byte
+# offsets in <name>.offset.npy and may hold any picklable value, e.g. strings.
+# All files are memory-mapped when reading.
+
+
+def is_ragged(field):
+    return field.pad or field.pack
+
+
+class ColumnarWriter:
+    def __init__(self, path, dataframe):
+        os.makedirs(path, exist_ok=True)
+
+        self.path = path
+        self.columns = [
+            (i, name, field)
+            for i, (name, field) in enumerate(dataframe.fields.items())
+            if not isinstance(field, Derived)
+        ]
+        self.files = {
+            name: open(os.path.join(path, name + '.bin'), 'wb')
+            for _, name, _ in self.columns
+        }
+        self.dtypes = {}
+        self.shapes = {name: [] for _, name, _ in self.columns}
+        self.length = 0
+
+    def write(self, sample):
+        named = is_named(sample)
+
+        for i, name, field in self.columns:
+            value = sample[name if named else i]
+
+            if field.listify:
+                data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+                self.files[name].write(data)
+                self.shapes[name].append(len(data))
+
+                continue
+
+            if np.isscalar(value):
+                value = np.asarray(value, dtype=field.dtype)
+
+            else:
+                value = convert2numpy(value, field.dtype)
+
+            if name not in self.dtypes:
+                if value.dtype.kind in 'OSUV':
+                    raise ValueError(f'column {name} is not numeric: {value.dtype}')
+
+                self.dtypes[name] = value.dtype
+
+            value = np.ascontiguousarray(value, dtype=self.dtypes[name])
+
+            if not is_ragged(field) and self.shapes[name]:
+                if value.shape != self.shapes[name][0]:
+                    raise ValueError(
+                        f'column {name} expects shape {self.shapes[name][0]}, '
+                        f'got {value.shape}'
+                    )
+
+            else:
+                self.shapes[name].append(value.shape)
+
+            self.files[name].write(memoryview(value.reshape(-1)))
+
+        self.length += 1
+
+    def close(self):
+        columns = OrderedDict()
+
+        for _, name, field in self.columns:
+            self.files[name].close()
+            dtype = self.dtypes.get(name, np.dtype(np.float32))
+            shapes = self.shapes[name]
+
+            if field.listify:
+                offsets = np.zeros(len(shapes) + 1, dtype=np.int64)
+                np.cumsum(shapes, out=offsets[1:])
+                np.save(os.path.join(self.path, name + '.offset.npy'), offsets)
+                columns[name] = {'pickle': True}
+
+            elif is_ragged(field):
+                ndim = len(shapes[0]) if shapes else 1
+                shapes = np.array(shapes, dtype=np.int64).reshape(-1, ndim)
+                offsets = np.zeros(len(shapes) + 1, dtype=np.int64)
+                np.cumsum(shapes.prod(1), out=offsets[1:])
+                np.save(os.path.join(self.path, name + '.shape.npy'), shapes)
+                np.save(os.path.join(self.path, name + '.offset.npy'), offsets)
+                columns[name] = {'dtype': dtype.str, 'ragged': True, 'ndim': ndim}
+
+            else:
+                shape = list(shapes[0]) if shapes else []
+                columns[name] = {'dtype': dtype.str, 'ragged': False, 'shape': shape}
+
+        with open(os.path.join(self.path, 'meta.json'), 'w') as f:
+            json.dump({'length': self.length, 'columns': columns}, f)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def memmap(filename, dtype):
+    if os.path.getsize(filename) == 0:
+        return np.empty(0, dtype=dtype)
+
+    return np.memmap(filename, dtype=dtype, mode='r')
+
+
+class Column:
+    def __init__(self, path, name, meta, length):
+        self.name = name
+        self.pickled = meta.get('pickle', False)
+        self.ragged = meta.get('ragged', False)
+
+        if self.pickled:
+            self.data = memmap(os.path.join(path, name + '.bin'), np.uint8)
+            self.offsets = np.load(
+                os.path.join(path, name + '.offset.npy'), mmap_mode='r'
+            )
+
+            return
+
+        data = memmap(os.path.join(path, name + '.bin'), np.dtype(meta['dtype']))
+
+        if self.ragged:
+            self.data = data
+            self.offsets = np.load(
+                os.path.join(path, name + '.offset.npy'), mmap_mode='r'
+            )
+            self.shapes = np.load(
+                os.path.join(path, name + '.shape.npy'), mmap_mode='r'
+            )
+
+        else:
+            self.data = data.reshape(length, *meta['shape'])
+
+    def get(self, index):
+        if self.pickled:
+            start, end = self.offsets[index], self.offsets[index + 1]
+
+            return pickle.loads(self.data[start:end].tobytes())
+
+        if self.ragged:
+            start, end = self.offsets[index], self.offsets[index + 1]
+
+            return self.data[start:end].reshape(tuple(self.shapes[index]))
+
+        return self.data[index]
+
+    def gather(self, indices):
+        if self.pickled:
+            return [self.get(index) for index in indices]
+
+        if not self.ragged:
+            return self.data[indices]
+
+        # Element indices of all requested samples are built in one pass, so
+        # the whole column is read with a single fancy index.
+        starts = self.offsets[indices]
+        counts = self.offsets[indices + 1] - starts
+        total = int(counts.sum())
+        shift = np.repeat(starts - (np.cumsum(counts) - counts), counts)
+
+        return Ragged(self.data[np.arange(total) + shift], self.shapes[indices])
+
+
+class ColumnarDataset(Dataset):
+    def __init__(self, path):
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+
+        self.path = path
+        self.length = meta['length']
+        self.columns = OrderedDict(
+            (name, Column(path, name, column, self.length))
+            for name, column in meta['columns'].items()
+        )
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self.length))]
+
+        if index < 0:
+            index += self.length
+
+        if not 0 <= index < self.length:
+            raise IndexError(f'index {index} is out of range')
+
+        return Row(**{name: column.get(index) for name, column in self.columns.items()})
+
+    def __getitems__(self, indices):
+        indices = np.asarray(indices, dtype=np.int64)
+        indices = np.where(indices < 0, indices + self.length, indices)
+
+        return Columns(
+            **{name: column.gather(indices) for name, column in self.columns.items()}
+        )
@@ -1,24 +1,111 @@
+import os
 from collections import abc, OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from itertools import chain, islice
+from time import perf_counter
 
 import torch
 import numpy as np
 
+from .buffer import collate_dtype
+from .cache import DerivedCache, content_hash
+from .profiler import CollateProfiler
+from .record import BatchRecord, RowRecord, record_type
+
 
 class Field:
-    def __init__(self, pad=False, listify=False, dtype=None, infer=True):
+    def __init__(
+        self,
+        pad=False,
+        listify=False,
+        dtype=None,
+        infer=True,
+        pack=False,
+        pad_value=0,
+        lengths=False,
+        mask=False,
+    ):
+        if pad and pack:
+            raise ValueError('pad and pack cannot be used together')
+
         self.pad = pad
         self.listify = listify
         self.dtype = dtype
         self.infer = infer
+        self.pack = pack
+        self.pad_value = pad_value
+        self.lengths = lengths
+        self.mask = mask
 
 
 class Derived(Field):
-    def __init__(self, fn, need_batch=False, *args, **kwargs):
+    def __init__(
+        self,
+        fn,
+        need_batch=False,
+        *args,
+        batched=False,
+        executor='serial',
+        workers=None,
+        chunk_size=None,
+        cache=False,
+        cache_key=None,
+        cache_size=None,
+        cache_bytes=None,
+        cache_dir=None,
+        deps=None,
+        **kwargs,
+    ):
+        if executor not in ('serial', 'thread', 'process'):
+            raise ValueError(f'unknown executor {executor}')
+
+        if cache and need_batch:
+            raise ValueError(
+                'need_batch fields depend on the batch and cannot be cached'
+            )
+
         self.fn = fn
         self.need_batch = need_batch
+        self.batched = batched
+        self.executor = executor
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.pool = None
+        self.cache_key = cache_key
+        self.deps = None if deps is None else tuple(deps)
+
+        if cache:
+            self.cache = DerivedCache(cache_size, cache_bytes, cache_dir)
+
+        else:
+            self.cache = None
 
         super().__init__(*args, **kwargs)
 
+    def get_pool(self):
+        # Process pools cannot be created inside DataLoader workers, as they
+        # are daemonic processes.
+        if self.pool is None:
+            if self.executor == 'thread':
+                self.pool = ThreadPoolExecutor(self.workers)
+
+            else:
+                self.pool = ProcessPoolExecutor(self.workers)
+
+        return self.pool
+
+    def shutdown(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['pool'] = None
+
+        return state
+
 
 class Batch(OrderedDict):
     def __init__(self, *args, **kwargs):
@@ -85,7 +172,13 @@ class Row(OrderedDict):
 
     def __getitem__(self, key):
         if isinstance(key, int):
-            return super().__getitem__(list(super().keys())[0])
+            if key < 0:
+                key += len(self)
+
+            for value in islice(super().values(), key, None):
+                return value
+
+            raise IndexError(key)
 
         else:
             return super().__getitem__(key)
@@ -97,66 +190,792 @@ class Row(OrderedDict):
         super().__setitem__(name, value)
 
 
+class Ragged:
+    # Variable shaped samples of one column stored as a flat array of all
+    # elements together with the (batch, ndim) array of sample shapes.
+
+    def __init__(self, values, shapes):
+        self.values = np.asarray(values).reshape(-1)
+        self.shapes = np.asarray(shapes, dtype=np.int64)
+
+        if self.shapes.ndim == 1:
+            self.shapes = self.shapes[:, None]
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        arrays = [np.asarray(a) for a in arrays]
+
+        return cls(
+            np.concatenate([a.reshape(-1) for a in arrays]),
+            [a.shape for a in arrays],
+        )
+
+    @property
+    def ndim(self):
+        return self.shapes.shape[1]
+
+    @property
+    def lengths(self):
+        return self.shapes[:, 0]
+
+    @property
+    def offsets(self):
+        offsets = np.zeros(len(self.shapes) + 1, dtype=np.int64)
+        np.cumsum(self.shapes.prod(1), out=offsets[1:])
+
+        return offsets
+
+    def split(self):
+        offsets = self.offsets.tolist()
+
+        return [
+            self.values[start:end].reshape(shape)
+            for start, end, shape in zip(
+                offsets[:-1], offsets[1:], map(tuple, self.shapes.tolist())
+            )
+        ]
+
+    def __len__(self):
+        return len(self.shapes)
+
+
+class Columns(OrderedDict):
+    # Batch level samples returned by Dataset.__getitems__. Values are arrays
+    # with the batch on the first dimension, Ragged columns, or lists.
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+
+    @property
+    def size(self):
+        return len(next(iter(self.values())))
+
+    def rows(self):
+        columns = [
+            (name, column.split() if isinstance(column, Ragged) else column)
+            for name, column in self.items()
+        ]
+
+        return [
+            Row(**{name: column[i] for name, column in columns})
+            for i in range(self.size)
+        ]
+
+
+def is_named(sample):
+    return isinstance(sample, (Row, RowRecord))
+
+
+def element_kind(value):
+    if isinstance(value, np.ndarray):
+        return 'array'
+
+    elif isinstance(value, torch.Tensor):
+        return 'tensor'
+
+    elif isinstance(value, abc.Iterable):
+        return 'iterable'
+
+    else:
+        return 'scalar'
+
+
+def make_converter(kind, dtype=None):
+    if kind in ('array', 'tensor'):
+        return np.asarray
+
+    elif kind == 'iterable':
+        if dtype is not None:
+            return lambda seq: np.array(seq, dtype=dtype)
+
+        return np.array
+
+    else:
+        return lambda seq: convert2numpy(seq, dtype)
+
+
+def apply_chunk(fn, args, chunk):
+    return [fn(b, *args) for b in chunk]
+
+
+def make_compute(field):
+    fn = field.fn
+
+    if field.batched:
+
+        def compute(batch, results):
+            if field.need_batch:
+                return fn(batch, results)
+
+            return fn(batch)
+
+    elif field.executor != 'serial':
+
+        def compute(batch, results):
+            chunk_size = field.chunk_size
+
+            if chunk_size is None:
+                chunk_size = -(-len(batch) // (field.workers or os.cpu_count() or 1))
+
+            chunks = [
+                batch[start : start + chunk_size]
+                for start in range(0, len(batch), chunk_size)
+            ]
+            args = (results,) if field.need_batch else ()
+            values = field.get_pool().map(partial(apply_chunk, fn, args), chunks)
+
+            return [value for chunk_values in values for value in chunk_values]
+
+    elif field.need_batch:
+
+        def compute(batch, results):
+            return [fn(b, results) for b in batch]
+
+    else:
+
+        def compute(batch, results):
+            return [fn(b) for b in batch]
+
+    return compute
+
+
+def make_derive(field, ind, key_inds=None):
+    compute = make_compute(field)
+    cache = field.cache
+
+    if cache is None:
+
+        def derive(batch, results):
+            for b, value in zip(batch, compute(batch, results)):
+                b[ind] = value
+
+        return derive
+
+    key_fn = field.cache_key
+
+    if key_fn is None:
+        key_fn = partial(content_hash, keys=key_inds)
+
+    def derive(batch, results):
+        keys = [key_fn(b) for b in batch]
+        missing = []
+
+        for i, (b, key) in enumerate(zip(batch, keys)):
+            found, value = cache.get(key)
+
+            if found:
+                b[ind] = value
+
+            else:
+                missing.append(i)
+
+        if missing:
+            values = compute([batch[i] for i in missing], results)
+
+            for i, value in zip(missing, values):
+                batch[i][ind] = value
+                cache.put(keys[i], value)
+
+    return derive
+
+
+def collate_listify(step, values, results, pool=None):
+    results[step.name] = values
+
+
+def pad_output(step, dtype, shape, pool=None):
+    pad_value = step.field.pad_value
+
+    if pool is not None:
+        # Samples are cast while being written into the reused buffer, which
+        # skips both the per batch allocation and the float64 -> float32 copy.
+        tensor = pool.get(step.name, collate_dtype(dtype), shape)
+        tensor.fill_(pad_value)
+
+        return tensor, tensor.numpy()
+
+    if pad_value == 0:
+        return None, np.zeros(shape, dtype=dtype)
+
+    return None, np.full(shape, pad_value, dtype=dtype)
+
+
+def collate_pad(step, values, results, pool=None):
+    batch_array = [step.convert(v) for v in values]
+    field = step.field
+
+    max_sizes = []
+    for j in range(batch_array[0].ndim):
+        max_size = max(b.shape[j] for b in batch_array)
+        max_sizes.append(max_size)
+
+    shape = (len(values), *max_sizes)
+    tensor, output = pad_output(step, batch_array[0].dtype, shape, pool)
+
+    if field.mask:
+        mask = np.zeros(shape, dtype=np.bool_)
+
+    for batch_ind, b in enumerate(batch_array):
+        slices = (batch_ind, *[slice(s) for s in b.shape])
+        output[slices] = b
+
+        if field.mask:
+            mask[slices] = True
+
+    if tensor is None:
+        tensor = torch.from_numpy(convert_numpy_dtype(output))
+
+    results[step.name] = tensor
+
+    if field.lengths:
+        lengths = np.array([b.shape for b in batch_array], dtype=np.int64)
+
+        # 1-D samples have one length each, as on the pad_ragged_1d path
+        if len(max_sizes) == 1:
+            lengths = lengths[:, 0]
+
+        results[step.name + '_lengths'] = torch.from_numpy(lengths)
+
+    if field.mask:
+        results[step.name + '_mask'] = torch.from_numpy(mask)
+
+
+def collate_pad_1d(step, values, results, pool=None):
+    # Ragged 1-D samples given as sequences are read into one flat array in a
+    # single pass and scattered into the padded matrix with a length mask,
+    # instead of converting and assigning one row at a time.
+    batch_size = len(values)
+    dtype = step.convert(values[0]).dtype
+    lengths = np.fromiter(map(len, values), dtype=np.int64, count=batch_size)
+    flat = np.fromiter(chain.from_iterable(values), dtype, int(lengths.sum()))
+    pad_ragged_1d(step, flat, lengths, dtype, results, pool)
+
+
+def pad_ragged_1d(step, flat, lengths, dtype, results, pool=None):
+    field = step.field
+    shape = (len(lengths), int(lengths.max()))
+    tensor, output = pad_output(step, dtype, shape, pool)
+
+    mask = np.arange(shape[1]) < lengths[:, None]
+    output[mask] = flat
+
+    if tensor is None:
+        tensor = torch.from_numpy(convert_numpy_dtype(output))
+
+    results[step.name] = tensor
+
+    if field.lengths:
+        results[step.name + '_lengths'] = torch.from_numpy(lengths)
+
+    if field.mask:
+        results[step.name + '_mask'] = torch.from_numpy(mask)
+
+
+def collate_pack(step, values, results, pool=None):
+    # Samples are concatenated along the first dimension. Sample i occupies
+    # rows cu_seqlens[i]:cu_seqlens[i + 1] and segment_ids holds the sample
+    # index of every row.
+    batch_array = [step.convert(v) for v in values]
+    lengths = np.array([b.shape[0] for b in batch_array], dtype=np.int64)
+    cu_seqlens = np.zeros(len(values) + 1, dtype=np.int32)
+    np.cumsum(lengths, out=cu_seqlens[1:])
+    segment_ids = np.repeat(np.arange(len(values)), lengths)
+
+    output = np.concatenate(batch_array, axis=0)
+
+    results[step.name] = torch.from_numpy(convert_numpy_dtype(output))
+    results[step.name + '_cu_seqlens'] = torch.from_numpy(cu_seqlens)
+    results[step.name + '_segment_ids'] = torch.from_numpy(segment_ids)
+
+
+def collate_stack(step, values, results, pool=None):
+    if step.kind == 'scalar':
+        output = np.array(values).reshape(len(values), 1)
+
+    else:
+        output = np.stack(values, axis=0)
+
+    results[step.name] = torch.from_numpy(convert_numpy_dtype(output))
+
+
+def collate_column(step, column, results, pool=None):
+    # Collates a whole column of a Columns batch without per sample objects.
+    name = step.name
+    field = step.field
+
+    if field.listify:
+        results[name] = column.split() if isinstance(column, Ragged) else list(column)
+
+    elif isinstance(column, Ragged):
+        if field.pad and column.ndim == 1:
+            values = column.values
+            pad_ragged_1d(step, values, column.lengths, values.dtype, results, pool)
+
+        elif field.pack and np.all(column.shapes[:, 1:] == column.shapes[0, 1:]):
+            values = column.values.reshape(-1, *column.shapes[0, 1:].tolist())
+            cu_seqlens = np.zeros(len(column) + 1, dtype=np.int32)
+            np.cumsum(column.lengths, out=cu_seqlens[1:])
+            segment_ids = np.repeat(np.arange(len(column)), column.lengths)
+
+            results[name] = torch.from_numpy(convert_numpy_dtype(values))
+            results[name + '_cu_seqlens'] = torch.from_numpy(cu_seqlens)
+            results[name + '_segment_ids'] = torch.from_numpy(segment_ids)
+
+        else:
+            step.collate(step, column.split(), results, pool)
+
+    elif field.pad or field.pack:
+        # Dense columns have no padding, so they reuse the sample path.
+        step.collate(step, list(column), results, pool)
+
+    else:
+        output = np.asarray(column)
+
+        # Scalars are stacked as (batch, 1), as on the sample path
+        if output.ndim == 1:
+            output = output.reshape(-1, 1)
+
+        results[name] = torch.from_numpy(convert_numpy_dtype(output))
+
+
+class CollateStep:
+    def __init__(self, name, ind, field, key_inds=None):
+        self.name = name
+        self.ind = ind
+        self.field = field
+        self.kind = None
+        self.convert = None
+
+        if isinstance(field, Derived):
+            self.derive = make_derive(field, ind, key_inds)
+
+        else:
+            self.derive = None
+
+        if field.listify:
+            self.collate = collate_listify
+
+        elif field.pad:
+            self.collate = collate_pad
+
+        elif field.pack:
+            self.collate = collate_pack
+
+        else:
+            self.collate = collate_stack
+
+    def bind(self, value):
+        self.kind = element_kind(value)
+        self.convert = make_converter(self.kind, self.field.dtype)
+
+        # Arrays and tensors are copied row by row, which numpy does faster
+        # than the mask scatter, and scalars are padded as (batch, 1)
+        if (
+            self.collate is collate_pad
+            and self.kind == 'iterable'
+            and self.convert(value).ndim == 1
+        ):
+            self.collate = collate_pad_1d
+
+
 class DataFrame:
     def __init__(self, **kwargs):
         self.fields = OrderedDict(kwargs.items())
+        self.plans = {}
+        self.executor = None
+        self.executor_workers = 0
+        self.profiler = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['executor'] = None
+
+        return state
+
+    def lengths(self, dataset):
+        # Length of a sample is the largest size along the first dimension of
+        # its padded or packed fields. Derived fields are not evaluated.
+        fields = [
+            (name, i)
+            for i, (name, field) in enumerate(self.fields.items())
+            if (field.pad or field.pack) and not isinstance(field, Derived)
+        ]
+
+        if not fields:
+            raise ValueError('lengths need a pad or pack field that is not derived')
+
+        lengths = np.zeros(len(dataset), dtype=np.int64)
+
+        for sample_ind in range(len(dataset)):
+            sample = dataset[sample_ind]
+            named = is_named(sample)
+            lengths[sample_ind] = max(
+                len(sample[name if named else i]) for name, i in fields
+            )
+
+        return lengths
+
+    def collate_fn(
+        self,
+        infer=False,
+        compile=True,
+        pool=None,
+        fields=None,
+        workers=0,
+        compact=False,
+    ):
+        if fields is not None:
+            fields = tuple(fields)
+
+        return lambda batch: self._collate_fn(
+            batch, infer, compile, pool, fields, workers, compact
+        )
+
+    def row_type(self):
+        return record_type('row', self.fields.keys())
+
+    def output_names(self, infer=False, fields=None):
+        # Outputs follow the declaration order, whatever order the fields
+        # are computed in.
+        names = []
+
+        for _, name, _, emit in sorted(self.resolve(infer, fields)):
+            if not emit:
+                continue
 
-    def collate_fn(self, infer=False):
-        return lambda batch: self._collate_fn(batch, infer)
+            field = self.fields[name]
+            names.append(name)
 
-    def _collate_fn(self, batch, infer=False):
-        results = Batch()
+            if field.listify:
+                continue
+
+            if field.pad:
+                if field.lengths:
+                    names.append(name + '_lengths')
+
+                if field.mask:
+                    names.append(name + '_mask')
+
+            elif field.pack:
+                names.extend((name + '_cu_seqlens', name + '_segment_ids'))
+
+        return names
+
+    def batch_type(self, infer=False, fields=None):
+        key = BatchRecord, infer, fields
+        cls = self.plans.get(key)
+
+        if cls is None:
+            cls = record_type('batch', self.output_names(infer, fields))
+            self.plans[key] = cls
+
+        return cls
+
+    def compile(self, sample, infer=False, fields=None):
+        plan = self.build_plan([sample], infer, fields)
+        self.plans[is_named(sample), infer, fields] = plan
+
+        return plan
+
+    def reset_plans(self):
+        self.plans.clear()
+
+    def get_plan(self, batch, infer=False, fields=None):
+        if isinstance(batch, Columns):
+            key = Columns, infer, fields
+
+        else:
+            key = is_named(batch[0]), infer, fields
+
+        plan = self.plans.get(key)
+
+        if plan is None:
+            plan = self.build_plan(batch, infer, fields)
+            self.plans[key] = plan
+
+        return plan
+
+    def resolve(self, infer=False, fields=None):
+        # Orders the fields needed for the requested outputs. Derived fields
+        # with explicit deps only wait for (and pull in) those fields. Derived
+        # fields without deps wait for every field declared before them, which
+        # keeps the declaration order for schemas that do not use deps.
+        names = list(self.fields.keys())
+        position = {name: i for i, name in enumerate(names)}
+
+        if fields is None:
+            fields = names
+
+        for name in fields:
+            if name not in position:
+                raise KeyError(f'unknown field {name}')
 
-        batch_size = len(batch)
+        requested = {name for name in fields if not infer or self.fields[name].infer}
+        required = set()
+        stack = list(requested)
 
-        for i, (name, field) in enumerate(self.fields.items()):
-            if not field.infer and infer:
+        while stack:
+            name = stack.pop()
+
+            if name in required:
                 continue
 
-            if isinstance(batch[0], Row):
-                ind = name
+            required.add(name)
+            field = self.fields[name]
+
+            if isinstance(field, Derived) and field.deps is not None:
+                for dep in field.deps:
+                    if dep not in position:
+                        raise KeyError(f'{name} depends on unknown field {dep}')
+
+                    stack.append(dep)
+
+        deps = {}
+
+        for name in required:
+            field = self.fields[name]
+
+            if not isinstance(field, Derived):
+                deps[name] = set()
+
+            elif field.deps is None:
+                deps[name] = {n for n in names[: position[name]] if n in required}
 
             else:
-                ind = i
+                deps[name] = set(field.deps)
+
+        order = []
+        done = set()
+
+        while len(order) < len(required):
+            ready = [
+                name for name in required if name not in done and deps[name] <= done
+            ]
+
+            if not ready:
+                raise ValueError('derived fields have cyclic dependencies')
+
+            name = min(ready, key=position.get)
+            order.append(name)
+            done.add(name)
+
+        return [(position[name], name, deps[name], name in requested) for name in order]
+
+    def key_inputs(self, field):
+        # Default cache keys hash the declared deps, or else every non derived
+        # field. Other derived values are written into the same samples, so
+        # they would change the key of samples that are seen again.
+        names = list(self.fields)
+
+        if field.deps is not None:
+            keys = field.deps
 
-            # print(name)
+        else:
+            keys = [n for n in names if not isinstance(self.fields[n], Derived)]
+
+        return [(names.index(n), n) for n in keys]
+
+    def build_plan(self, batch, infer=False, fields=None):
+        # Field order, index style and collate strategies are fixed once per
+        # sample type. Element kinds are bound from the first value seen, which
+        # is only available after evaluation for the derived fields. Steps are
+        # grouped into waves of fields that do not depend on each other.
+        columns = isinstance(batch, Columns)
+        named = columns or is_named(batch[0])
+        plan = []
+        wave = 0
+        wave_names = set()
+
+        for i, name, deps, emit in self.resolve(infer, fields):
+            field = self.fields[name]
+            key_inds = None
 
             if isinstance(field, Derived):
-                for b in batch:
-                    if field.need_batch:
-                        b[ind] = field.fn(b, results)
+                key_inds = [n if named else j for j, n in self.key_inputs(field)]
 
-                    else:
-                        b[ind] = field.fn(b)
+            step = CollateStep(name, name if named else i, field, key_inds)
+            step.emit = emit
 
-            if field.listify:
-                output = []
+            if deps & wave_names:
+                wave += 1
+                wave_names = set()
 
-                for b in batch:
-                    output.append(b[ind])
+            step.wave = wave
+            wave_names.add(name)
 
-            elif field.pad:
-                batch_array = [convert2numpy(b[ind], field.dtype) for b in batch]
+            if step.derive is None:
+                if columns:
+                    step.kind = 'array'
+                    step.convert = np.asarray
 
-                max_sizes = []
-                for j in range(batch_array[0].ndim):
-                    max_size = max(b.shape[j] for b in batch_array)
-                    max_sizes.append(max_size)
+                else:
+                    step.bind(batch[0][step.ind])
 
-                output = np.zeros((batch_size, *max_sizes), dtype=batch_array[0].dtype)
+            plan.append(step)
 
-                for batch_ind, b in enumerate(batch_array):
-                    slices = [slice(s) for s in b.shape]
-                    # output.__setitem__((batch_ind, *slices), b)
-                    output[(batch_ind, *slices)] = b
+        return plan
 
-                output = torch.from_numpy(convert_numpy_dtype(output))
+    def get_executor(self, workers):
+        if self.executor is None or self.executor_workers != workers:
+            if self.executor is not None:
+                self.executor.shutdown()
 
-            else:
-                output = [convert2numpy(b[ind]) for b in batch]
-                output = np.stack(output, axis=0)
-                output = torch.from_numpy(convert_numpy_dtype(output))
+            self.executor = ThreadPoolExecutor(workers)
+            self.executor_workers = workers
+
+        return self.executor
+
+    def run_step(self, step, batch, columns, results, output, pool=None):
+        if columns is not None and step.derive is None:
+            collate_column(step, columns[step.name], output, pool)
+
+            return
+
+        if step.derive is not None:
+            step.derive(batch, results)
+
+        ind = step.ind
+        values = [b[ind] for b in batch]
+
+        if step.kind is None:
+            step.bind(values[0])
+
+        step.collate(step, values, output, pool)
+
+    def enable_profiling(self, profiler=None):
+        self.profiler = profiler if profiler is not None else CollateProfiler()
+
+        return self.profiler
+
+    def disable_profiling(self):
+        self.profiler = None
+
+    def profile(self):
+        if self.profiler is None:
+            return None
+
+        return self.profiler.report()
+
+    def profile_step(self, step, batch, columns, results, output, pool=None):
+        # Same as run_step, but also measures the step for the profiler.
+        field = step.field
+        profile = self.profiler.field(step.name)
+        n_outputs = len(output)
+        source_dtype = None
+        real = 0
+        start = perf_counter()
+
+        if columns is not None and step.derive is None:
+            column = columns[step.name]
+            collate_column(step, column, output, pool)
+
+            if isinstance(column, Ragged):
+                column = column.values
+
+            if not field.listify and isinstance(column, np.ndarray):
+                source_dtype = column.dtype
+                real = column.size
+
+            elif not field.listify:
+                # Ragged columns given as lists cannot be converted as a whole
+                source_dtype = step.convert(column[0]).dtype
+                real = sum(step.convert(v).size for v in column)
+
+        else:
+            if step.derive is not None:
+                derive_start = perf_counter()
+                step.derive(batch, results)
+                profile.derive_time += perf_counter() - derive_start
+
+            ind = step.ind
+            values = [b[ind] for b in batch]
+
+            if step.kind is None:
+                step.bind(values[0])
+
+            step.collate(step, values, output, pool)
+
+            if not field.listify:
+                source_dtype = step.convert(values[0]).dtype
+
+            if field.pad or field.pack:
+                real = sum(step.convert(v).size for v in values)
+
+        profile.time += perf_counter() - start
+        profile.calls += 1
+        outputs = list(output.values())[n_outputs:]
+        self.profiler.observe(profile, field, source_dtype, real, outputs)
+
+    def _collate_fn(
+        self,
+        batch,
+        infer=False,
+        compile=True,
+        pool=None,
+        fields=None,
+        workers=0,
+        compact=False,
+    ):
+        if compile:
+            plan = self.get_plan(batch, infer, fields)
+
+        else:
+            plan = self.build_plan(batch, infer, fields)
+
+        columns = None
+
+        if isinstance(batch, Columns):
+            columns = batch
+
+            # Derived fields are defined on samples, so rows are materialized
+            # only when the plan has them.
+            if any(step.derive is not None for step in plan):
+                batch = columns.rows()
+
+        results = Batch()
+        hidden = []
+        run_step = self.run_step if self.profiler is None else self.profile_step
+
+        if workers > 0:
+            executor = self.get_executor(workers)
+            waves = OrderedDict()
+
+            for step in plan:
+                waves.setdefault(step.wave, []).append(step)
+
+            for steps in waves.values():
+                outputs = [Batch() for _ in steps]
+                futures = [
+                    executor.submit(
+                        run_step, step, batch, columns, results, output, pool
+                    )
+                    for step, output in zip(steps, outputs)
+                ]
+
+                for step, output, future in zip(steps, outputs, futures):
+                    future.result()
+                    results.update(output)
+
+                    if not step.emit:
+                        hidden.extend(output.keys())
+
+        else:
+            for step in plan:
+                if step.emit:
+                    run_step(step, batch, columns, results, results, pool)
+
+                else:
+                    output = Batch()
+                    run_step(step, batch, columns, results, output, pool)
+                    results.update(output)
+                    hidden.extend(output.keys())
+
+        for name in hidden:
+            del results[name]
+
+        batch_type = self.batch_type(infer, fields)
 
-            results[name] = output
+        if compact:
+            return batch_type(**results)
 
-        return Batch(**results)
+        return Batch((name, results[name]) for name in batch_type._fields)
@@ -0,0 +1,137 @@
+import queue
+import threading
+from collections import deque
+from time import perf_counter
+
+import torch
+
+
+class Prefetcher:
+    # Moves batch N + 1 to the device while batch N is being consumed. On CUDA
+    # the copies are issued on a side stream, elsewhere a background thread runs
+    # the transfer. stall_time accumulates the time the consumer waited for a
+    # batch in the last iteration.
+
+    def __init__(self, loader, device, depth=2, transfer=None):
+        if depth < 1:
+            raise ValueError('depth should be at least 1')
+
+        self.loader = loader
+        self.device = torch.device(device)
+        self.depth = depth
+        self.transfer = transfer if transfer is not None else self.to_device
+
+        self.stall_time = 0.0
+        self.n_batches = 0
+
+    def to_device(self, batch):
+        return batch.to(self.device, non_blocking=True)
+
+    @property
+    def mean_stall(self):
+        if self.n_batches == 0:
+            return 0.0
+
+        return self.stall_time / self.n_batches
+
+    def __len__(self):
+        return len(self.loader)
+
+    def __iter__(self):
+        self.stall_time = 0.0
+        self.n_batches = 0
+
+        if self.device.type == 'cuda':
+            return self.iter_stream()
+
+        return self.iter_thread()
+
+    def iter_stream(self):
+        stream = torch.cuda.Stream(self.device)
+        loader = iter(self.loader)
+        pending = deque()
+
+        def issue():
+            start = perf_counter()
+            batch = next(loader, None)
+            self.stall_time += perf_counter() - start
+
+            if batch is None:
+                return
+
+            with torch.cuda.stream(stream):
+                batch = self.transfer(batch)
+                event = torch.cuda.Event()
+                event.record(stream)
+
+            pending.append((batch, event))
+
+        for _ in range(self.depth):
+            issue()
+
+        while pending:
+            batch, event = pending.popleft()
+            current = torch.cuda.current_stream(self.device)
+            current.wait_event(event)
+
+            for value in batch:
+                if isinstance(value, torch.Tensor):
+                    value.record_stream(current)
+
+            issue()
+            self.n_batches += 1
+
+            yield batch
+
+    def iter_thread(self):
+        batches = queue.Queue(maxsize=self.depth)
+        stop = threading.Event()
+        end = object()
+
+        def put(item):
+            while not stop.is_set():
+                try:
+                    batches.put(item, timeout=0.1)
+
+                    return True
+
+                except queue.Full:
+                    pass
+
+            return False
+
+        def worker():
+            try:
+                for batch in self.loader:
+                    if not put((self.transfer(batch), None)):
+                        return
+
+            except Exception as e:
+                put((None, e))
+
+                return
+
+            put((end, None))
+
+        thread = threading.Thread(target=worker, daemon=True)
+        thread.start()
+
+        try:
+            while True:
+                start = perf_counter()
+                batch, error = batches.get()
+                self.stall_time += perf_counter() - start
+
+                if error is not None:
+                    raise error
+
+                if batch is end:
+                    break
+
+                self.n_batches += 1
+
+                yield batch
+
+        finally:
+            stop.set()
+            thread.join()
@@ -0,0 +1,97 @@
+from collections import OrderedDict
+
+import numpy as np
+import torch
+
+
+class FieldProfile:
+    def __init__(self):
+        self.calls = 0
+        self.time = 0.0
+        self.derive_time = 0.0
+        self.bytes = 0
+        self.real = 0
+        self.padded = 0
+        self.conversions = 0
+        self.conversion_bytes = 0
+
+    @property
+    def padding_ratio(self):
+        if self.padded == 0:
+            return 0.0
+
+        return 1 - self.real / self.padded
+
+    def report(self):
+        return OrderedDict(
+            calls=self.calls,
+            time=self.time,
+            derive_time=self.derive_time,
+            bytes=self.bytes,
+            padding_ratio=self.padding_ratio,
+            conversions=self.conversions,
+            conversion_bytes=self.conversion_bytes,
+        )
+
+
+class CollateProfiler:
+    # Accumulates per field statistics of DataFrame collation. Profilers live
+    # in the process that collates, so with DataLoader workers every worker has
+    # its own copy; profile with num_workers=0 to read them in the main process.
+
+    def __init__(self):
+        self.fields = OrderedDict()
+
+    def field(self, name):
+        profile = self.fields.get(name)
+
+        if profile is None:
+            profile = FieldProfile()
+            self.fields[name] = profile
+
+        return profile
+
+    def observe(self, profile, field, source_dtype, real, outputs):
+        tensors = [output for output in outputs if isinstance(output, torch.Tensor)]
+
+        for tensor in tensors:
+            profile.bytes += tensor.numel() * tensor.element_size()
+
+        if not tensors:
+            return
+
+        main = tensors[0]
+
+        if field.pad or field.pack:
+            profile.real += real
+            profile.padded += main.numel()
+
+        if source_dtype == np.float64 and main.dtype == torch.float32:
+            profile.conversions += 1
+            profile.conversion_bytes += main.numel() * 8
+
+    def report(self):
+        return OrderedDict(
+            (name, profile.report()) for name, profile in self.fields.items()
+        )
+
+    def reset(self):
+        self.fields.clear()
+
+    def flatten(self):
+        values = OrderedDict()
+
+        for name, report in self.report().items():
+            for key, value in report.items():
+                values[f'{name}/{key}'] = value
+
+        return values
+
+    def recorder_set(self, **kwargs):
+        # Imported here as the recorder depends on scipy.
+        from ..util.recorder import RecorderSet
+
+        return RecorderSet(*self.flatten().keys(), **kwargs)
+
+    def record(self, recorder, step=None):
+        recorder.record(step, **self.flatten())
@@ -0,0 +1,151 @@
+from collections import abc
+
+import torch
+
+# Records are schema-bound alternatives to Row and Batch. Values live in
+# __slots__, so a record has no per instance dict and positional access maps
+# to an attribute lookup through the class level _fields tuple.
+
+
+class Record:
+    __slots__ = ()
+    _fields = ()
+
+    def __init__(self, *args, **kwargs):
+        # Like dict, a record can be built from a mapping of its fields, which
+        # is how generic code such as DataLoader's pin_memory rebuilds mappings
+        if (
+            len(args) == 1
+            and not kwargs
+            and isinstance(args[0], abc.Mapping)
+            and set(args[0].keys()) <= set(self._fields)
+        ):
+            args, kwargs = (), args[0]
+
+        for name, value in zip(self._fields, args):
+            setattr(self, name, value)
+
+        for name, value in kwargs.items():
+            self[name] = value
+
+    def __getitem__(self, key):
+        if isinstance(key, int):
+            key = self._fields[key]
+
+        try:
+            return getattr(self, key)
+
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __setitem__(self, key, value):
+        if isinstance(key, int):
+            key = self._fields[key]
+
+        try:
+            setattr(self, key, value)
+
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __delitem__(self, key):
+        if isinstance(key, int):
+            key = self._fields[key]
+
+        try:
+            delattr(self, key)
+
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __contains__(self, key):
+        return key in self._fields and hasattr(self, key)
+
+    def __len__(self):
+        return len(self.keys())
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+
+        except KeyError:
+            return default
+
+    def keys(self):
+        return [name for name in self._fields if hasattr(self, name)]
+
+    def values(self):
+        return [getattr(self, name) for name in self.keys()]
+
+    def items(self):
+        return [(name, getattr(self, name)) for name in self.keys()]
+
+    def __eq__(self, other):
+        if not isinstance(other, (Record, abc.Mapping)):
+            return NotImplemented
+
+        return dict(self.items()) == dict(other.items())
+
+    def __repr__(self):
+        values = ', '.join(f'{name}={value!r}' for name, value in self.items())
+
+        return f'{type(self).__name__}({values})'
+
+    def __reduce__(self):
+        return rebuild_record, (self._base, self._fields, dict(self.items()))
+
+
+class RowRecord(Record):
+    __slots__ = ()
+
+    def __iter__(self):
+        return iter(self.keys())
+
+
+class BatchRecord(Record):
+    __slots__ = ()
+
+    def __iter__(self):
+        return iter(self.values())
+
+    def to(self, *args, **kwargs):
+        for name, value in self.items():
+            if isinstance(value, torch.Tensor):
+                setattr(self, name, value.to(*args, **kwargs))
+
+        return self
+
+    def pin_memory(self):
+        values = {
+            name: value.pin_memory() if isinstance(value, torch.Tensor) else value
+            for name, value in self.items()
+        }
+
+        return type(self)(**values)
+
+
+abc.Mapping.register(Record)
+
+RECORD_BASES = {'row': RowRecord, 'batch': BatchRecord}
+RECORD_TYPES = {}
+
+
+def record_type(base, fields):
+    fields = tuple(fields)
+    key = base, fields
+    cls = RECORD_TYPES.get(key)
+
+    if cls is None:
+        base_cls = RECORD_BASES[base]
+        cls = type(
+            base_cls.__name__,
+            (base_cls,),
+            {'__slots__': fields, '_fields': fields, '_base': base},
+        )
+        RECORD_TYPES[key] = cls
+
+    return cls
+
+
+def rebuild_record(base, fields, values):
+    return record_type(base, fields)(**values)
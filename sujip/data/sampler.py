@@ -0,0 +1,185 @@
+import numpy as np
+from torch.utils.data import Sampler
+
+
+def padding_efficiency(lengths, batches):
+    real = 0
+    padded = 0
+
+    for batch in batches:
+        batch_lengths = lengths[batch]
+        real += int(batch_lengths.sum())
+        padded += len(batch) * int(batch_lengths.max())
+
+    if padded == 0:
+        return 1.0
+
+    return real / padded
+
+
+class LengthBatchSampler(Sampler):
+    @classmethod
+    def from_dataframe(cls, dataframe, dataset, *args, **kwargs):
+        return cls(dataframe.lengths(dataset), *args, **kwargs)
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def rng(self):
+        return np.random.default_rng((self.seed, self.epoch))
+
+    def batches(self):
+        raise NotImplementedError
+
+    def padding_efficiency(self):
+        return padding_efficiency(self.lengths, self.batches())
+
+    def __iter__(self):
+        return iter(self.batches())
+
+    def __len__(self):
+        return len(self.batches())
+
+
+class BucketBatchSampler(LengthBatchSampler):
+    def __init__(
+        self,
+        lengths,
+        batch_size,
+        boundaries=None,
+        n_buckets=10,
+        shuffle=True,
+        drop_last=False,
+        seed=0,
+    ):
+        self.lengths = np.asarray(lengths, dtype=np.int64)
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+        self.seed = seed
+        self.epoch = 0
+
+        if boundaries is None:
+            if self.lengths.size == 0:
+                raise ValueError(
+                    'boundaries cannot be estimated from empty lengths, '
+                    'pass them explicitly'
+                )
+
+            quantiles = np.linspace(0, 1, n_buckets + 1)[1:-1]
+            boundaries = np.unique(
+                np.quantile(self.lengths, quantiles).astype(np.int64)
+            )
+
+        self.boundaries = np.asarray(boundaries, dtype=np.int64)
+        bucket_ids = np.searchsorted(self.boundaries, self.lengths, side='right')
+        self.buckets = [
+            np.flatnonzero(bucket_ids == i) for i in range(len(self.boundaries) + 1)
+        ]
+
+    def batches(self):
+        rng = self.rng()
+        batches = []
+
+        for bucket in self.buckets:
+            if self.shuffle:
+                bucket = rng.permutation(bucket)
+
+            else:
+                # Sorting inside a bucket keeps the batches as tight as possible
+                # when the order does not need to be random.
+                bucket = bucket[np.argsort(self.lengths[bucket], kind='stable')]
+
+            for start in range(0, len(bucket), self.batch_size):
+                batch = bucket[start : start + self.batch_size]
+
+                if self.drop_last and len(batch) < self.batch_size:
+                    continue
+
+                batches.append(batch.tolist())
+
+        if self.shuffle:
+            batches = [batches[i] for i in rng.permutation(len(batches))]
+
+        return batches
+
+    def __len__(self):
+        total = 0
+
+        for bucket in self.buckets:
+            if self.drop_last:
+                total += len(bucket) // self.batch_size
+
+            else:
+                total += -(-len(bucket) // self.batch_size)
+
+        return total
+
+
+class TokenBudgetBatchSampler(LengthBatchSampler):
+    # Packs samples until batch size times the longest length in the batch
+    # would exceed max_tokens, which bounds the padded elements of a batch.
+    # Samples are sorted by length inside windows of sort_window shuffled
+    # samples so that batches stay tight without losing randomness. A sample
+    # that is longer than the budget by itself forms a single sample batch.
+
+    def __init__(
+        self,
+        lengths,
+        max_tokens,
+        max_batch_size=None,
+        sort_window=None,
+        shuffle=True,
+        seed=0,
+    ):
+        self.lengths = np.asarray(lengths, dtype=np.int64)
+        self.max_tokens = max_tokens
+        self.max_batch_size = max_batch_size
+        self.sort_window = sort_window
+        self.shuffle = shuffle
+        self.seed = seed
+        self.epoch = 0
+
+    def order(self, rng):
+        if not self.shuffle:
+            return np.argsort(self.lengths, kind='stable')
+
+        order = rng.permutation(len(self.lengths))
+
+        if self.sort_window is None:
+            return order[np.argsort(self.lengths[order], kind='stable')]
+
+        for start in range(0, len(order), self.sort_window):
+            window = order[start : start + self.sort_window]
+            order[start : start + self.sort_window] = window[
+                np.argsort(self.lengths[window], kind='stable')
+            ]
+
+        return order
+
+    def batches(self):
+        rng = self.rng()
+        order = self.order(rng)
+        batches = []
+        batch = []
+        max_len = 0
+
+        for ind, length in zip(order.tolist(), self.lengths[order].tolist()):
+            new_max = max(max_len, length)
+            full = self.max_batch_size is not None and len(batch) >= self.max_batch_size
+
+            if batch and (full or (len(batch) + 1) * new_max > self.max_tokens):
+                batches.append(batch)
+                batch = []
+                new_max = length
+
+            batch.append(ind)
+            max_len = new_max
+
+        if batch:
+            batches.append(batch)
+
+        if self.shuffle:
+            batches = [batches[i] for i in rng.permutation(len(batches))]
+
+        return batches
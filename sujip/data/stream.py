@@ -0,0 +1,176 @@
+import numpy as np
+import torch.distributed as dist
+from torch.utils.data import DataLoader, IterableDataset, get_worker_info
+
+
+def identity(batch):
+    return batch
+
+
+class ShardedStream(IterableDataset):
+    # Streams samples from shards through a bounded shuffle buffer, batches them
+    # and collates them with a DataFrame. Shards are assigned round robin to
+    # every (rank, worker) pair after a per epoch shuffle, so memory only
+    # depends on shuffle_buffer and batch_size. stream.loader() builds a
+    # DataLoader that passes the collated batches through unchanged, tagged
+    # with the role of the worker that produced them; iterate through
+    # stream.track(loader) to get the batches.
+    #
+    # track() counts consumed batches per worker role, so after
+    # load_state_dict every worker replays exactly its own part of the stream
+    # without collating the batches that were already consumed. DataLoader
+    # asks the workers in turn, skipping exhausted ones, so roles are rotated
+    # to make the worker asked first take the role that was due next. The
+    # counts are reset once a pass over the stream finishes.
+
+    def __init__(
+        self,
+        shards,
+        read_fn,
+        dataframe,
+        batch_size,
+        shuffle_buffer=0,
+        infer=False,
+        drop_last=False,
+        seed=0,
+        rank=None,
+        world_size=None,
+    ):
+        if rank is None or world_size is None:
+            if dist.is_available() and dist.is_initialized():
+                rank, world_size = dist.get_rank(), dist.get_world_size()
+
+            else:
+                rank, world_size = 0, 1
+
+        self.shards = list(shards)
+        self.read_fn = read_fn
+        self.dataframe = dataframe
+        self.collate = dataframe.collate_fn(infer)
+        self.batch_size = batch_size
+        self.shuffle_buffer = shuffle_buffer
+        self.drop_last = drop_last
+        self.seed = seed
+        self.rank = rank
+        self.world_size = world_size
+
+        self.epoch = 0
+        self.reset()
+
+    def reset(self):
+        self.consumed = 0
+        self.worker_consumed = None
+        self.next_role = 0
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+        self.reset()
+
+    def state_dict(self):
+        return {
+            'epoch': self.epoch,
+            'consumed': self.consumed,
+            'worker_consumed': self.worker_consumed,
+            'next_role': self.next_role,
+        }
+
+    def load_state_dict(self, state):
+        self.epoch = state['epoch']
+        self.consumed = state['consumed']
+        self.worker_consumed = state['worker_consumed']
+        self.next_role = state['next_role']
+
+    def loader(self, **kwargs):
+        return DataLoader(self, batch_size=None, collate_fn=identity, **kwargs)
+
+    def track(self, loader):
+        num_workers = max(loader.num_workers, 1)
+
+        if self.worker_consumed is None:
+            self.worker_consumed = [0] * num_workers
+
+        elif len(self.worker_consumed) != num_workers:
+            raise ValueError(
+                'cannot resume with {} workers, the state was saved with {}'.format(
+                    num_workers, len(self.worker_consumed)
+                )
+            )
+
+        for role, batch in loader:
+            self.consumed += 1
+            self.worker_consumed[role] += 1
+            self.next_role = (role + 1) % num_workers
+
+            yield batch
+
+        self.reset()
+
+    def worker(self):
+        info = get_worker_info()
+
+        if info is None:
+            return 0, 1
+
+        return info.id, info.num_workers
+
+    def samples(self, shards, rng):
+        for shard in shards:
+            yield from self.read_fn(shard)
+
+    def shuffle(self, samples, rng):
+        if self.shuffle_buffer <= 1:
+            yield from samples
+
+            return
+
+        buffer = []
+
+        for sample in samples:
+            if len(buffer) < self.shuffle_buffer:
+                buffer.append(sample)
+
+                continue
+
+            index = rng.integers(len(buffer))
+            yield buffer[index]
+            buffer[index] = sample
+
+        for index in rng.permutation(len(buffer)):
+            yield buffer[index]
+
+    def __iter__(self):
+        worker_id, num_workers = self.worker()
+        # DataLoader asks worker 0 first, so it takes over the role that was
+        # due next when the state was saved
+        role = (worker_id + self.next_role) % num_workers
+        slot = self.rank * num_workers + role
+        n_slots = self.world_size * num_workers
+
+        order = np.random.default_rng((self.seed, self.epoch)).permutation(
+            len(self.shards)
+        )
+        shards = [self.shards[i] for i in order[slot::n_slots]]
+        rng = np.random.default_rng((self.seed, self.epoch, slot))
+
+        skip = 0
+        if self.worker_consumed is not None:
+            skip = self.worker_consumed[role]
+
+        batch = []
+
+        for sample in self.shuffle(self.samples(shards, rng), rng):
+            batch.append(sample)
+
+            if len(batch) < self.batch_size:
+                continue
+
+            if skip > 0:
+                skip -= 1
+
+            else:
+                yield role, self.collate(batch)
+
+            batch = []
+
+        if batch and not self.drop_last and skip == 0:
+            yield role, self.collate(batch)
@@ -0,0 +1,137 @@
+import time
+from collections import OrderedDict, deque
+
+import torch
+from torch.utils.data import get_worker_info
+
+from .dataframe import Batch
+
+
+def align(offset, alignment=64):
+    return (offset + alignment - 1) // alignment * alignment
+
+
+class SharedBatch:
+    def __init__(self, slot, names, tensors, others):
+        self.slot = slot
+        self.names = names
+        self.tensors = tensors
+        self.others = others
+
+
+class SharedMemoryTransport:
+    # Returns collated batches from DataLoader workers through shared memory
+    # slabs that are allocated before the workers start, so only a small
+    # SharedBatch descriptor is pickled per batch. Every worker owns n_slots
+    # slots and the main process rebuilds batches as views into them.
+    #
+    # A slot is released when `keep` newer batches have been received, so views
+    # of a batch are only valid for that long; clone anything that should live
+    # longer. n_slots should be at least the DataLoader prefetch_factor plus
+    # keep, otherwise the workers wait for free slots. Batches that do not fit
+    # into a slot fall back to regular pickling.
+
+    def __init__(self, slot_bytes, n_slots=4, num_workers=0, timeout=60):
+        self.slot_bytes = slot_bytes
+        self.n_slots = n_slots
+        self.timeout = timeout
+
+        total_slots = max(num_workers, 1) * n_slots
+        self.slabs = torch.empty(total_slots, slot_bytes, dtype=torch.uint8)
+        self.slabs.share_memory_()
+        self.busy = torch.zeros(total_slots, dtype=torch.int32)
+        self.busy.share_memory_()
+
+        self.cursor = 0
+
+    def collate_fn(self, collate):
+        return lambda batch: self.send(collate(batch))
+
+    def acquire(self):
+        info = get_worker_info()
+        worker = info.id if info is not None else 0
+        slot = worker * self.n_slots + self.cursor
+        self.cursor = (self.cursor + 1) % self.n_slots
+
+        start = time.perf_counter()
+
+        while self.busy[slot].item() != 0:
+            if time.perf_counter() - start > self.timeout:
+                raise RuntimeError(
+                    f'shared memory slot {slot} was not released in {self.timeout}s'
+                )
+
+            time.sleep(1e-4)
+
+        return slot
+
+    def send(self, batch):
+        slot = self.acquire()
+        slab = self.slabs[slot]
+        names = []
+        tensors = []
+        others = OrderedDict()
+        offset = 0
+
+        for name, value in batch.items():
+            names.append(name)
+
+            if not isinstance(value, torch.Tensor) or value.device.type != 'cpu':
+                others[name] = value
+
+                continue
+
+            offset = align(offset)
+            nbytes = value.numel() * value.element_size()
+
+            if offset + nbytes > self.slot_bytes:
+                return batch
+
+            slab[offset : offset + nbytes].view(value.dtype).view(value.shape).copy_(
+                value
+            )
+            tensors.append((name, value.dtype, tuple(value.shape), offset))
+            offset += nbytes
+
+        self.busy[slot] = 1
+
+        return SharedBatch(slot, names, tensors, others)
+
+    def receive(self, shared):
+        if not isinstance(shared, SharedBatch):
+            return shared
+
+        slab = self.slabs[shared.slot]
+        values = dict(shared.others)
+
+        for name, dtype, shape, offset in shared.tensors:
+            numel = 1
+            for size in shape:
+                numel *= size
+
+            nbytes = numel * torch.empty((), dtype=dtype).element_size()
+            values[name] = slab[offset : offset + nbytes].view(dtype).view(shape)
+
+        return Batch(**{name: values[name] for name in shared.names})
+
+    def release(self, slot):
+        self.busy[slot] = 0
+
+    def wrap(self, loader, keep=1):
+        held = deque()
+
+        try:
+            for item in loader:
+                batch = self.receive(item)
+
+                if isinstance(item, SharedBatch):
+                    held.append(item.slot)
+
+                while len(held) > keep:
+                    self.release(held.popleft())
+
+                yield batch
+
+        finally:
+            while held:
+                self.release(held.popleft())
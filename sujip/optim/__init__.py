@@ -1,6 +1,8 @@
 from .updater import Updater
+from .adamw import AdamW
 from .lamb import LAMB
 from .qhadam import QHAdam
+from .sharded import ShardedOptimizer, sharded
 from .scheduler import CycleAnnealScheduler, CycleScheduler
 
 from .scheduler_args import CycleSchedulerArgs, LRFinderArgs
@@ -48,5 +50,10 @@ def add_optimizer_args(parser, name='optim', registry=OPTIMIZER_REGISTRY):
     _add_args(parser, name, registry)
 
 
-def get_optimizer(args, name='optim', registry=OPTIMIZER_REGISTRY):
-    return _get_object(args, name=name, registry=registry)
+def get_optimizer(args, name='optim', registry=OPTIMIZER_REGISTRY, shard=False):
+    optimizer = _get_object(args, name=name, registry=registry)
+
+    if shard and optimizer is not None:
+        optimizer = sharded(optimizer)
+
+    return optimizer
@@ -0,0 +1,195 @@
+from functools import partial
+
+import torch
+
+from .foreach import group_tensors
+
+
+class FlatBuffer:
+    """Packs parameters of one device and dtype into contiguous flat buffers.
+
+    Parameter data and gradients become views into ``data`` and ``grad``, so
+    an optimizer can update all of them with a few large ops. Parameters must
+    not be moved or reassigned afterwards, as that would break the views.
+
+    ``segments`` splits an update into runs of consecutive parameters that
+    have gradients, so parameters without one are left untouched, as on the
+    per-parameter path.
+    """
+
+    def __init__(self, params):
+        self.params = params
+        self.numels = [p.numel() for p in params]
+        self.offsets = [0]
+        for numel in self.numels:
+            self.offsets.append(self.offsets[-1] + numel)
+        self.data = torch.cat([p.data.reshape(-1) for p in params])
+        self.grad = torch.zeros_like(self.data)
+
+        self.grads = self.views(self.grad)
+
+        for p, view, grad in zip(params, self.views(self.data), self.grads):
+            if p.grad is not None:
+                grad.copy_(p.grad.data)
+                p.grad = grad
+
+            p.data = view
+
+    def views(self, flat):
+        return [
+            view.view_as(p) for view, p in zip(flat.split(self.numels), self.params)
+        ]
+
+    def gather_grads(self):
+        """Collects gradients into the flat gradient buffer.
+
+        Gradients replaced since the last step (e.g. by autograd after
+        ``zero_grad(set_to_none=True)``) are copied back into the buffer.
+        Missing gradients stay None, and their parameters are marked as
+        inactive for the step.
+        """
+        self.active = [p.grad is not None for p in self.params]
+
+        for p, grad in zip(self.params, self.grads):
+            if p.grad is not None and p.grad.data_ptr() != grad.data_ptr():
+                grad.copy_(p.grad.data)
+                p.grad = grad
+
+        return self.grad
+
+    def segments(self, state, scalars):
+        """Yields (data, grad, state, numels) for runs of consecutive active
+        parameters.
+
+        Scalar state such as step counts is kept per parameter in lists under
+        the ``scalars`` keys, as parameters without gradients skip steps. Runs
+        also break where these differ, and every run gets views of the tensor
+        state and its own scalars, which are stored back once it is updated.
+        """
+        n_params = len(self.params)
+
+        for key in scalars:
+            if not isinstance(state[key], list):
+                state[key] = [state[key]] * n_params
+
+        start = 0
+
+        while start < n_params:
+            if not self.active[start]:
+                start += 1
+
+                continue
+
+            end = start + 1
+
+            while (
+                end < n_params
+                and self.active[end]
+                and all(state[key][end] == state[key][start] for key in scalars)
+            ):
+                end += 1
+
+            begin, stop = self.offsets[start], self.offsets[end]
+            run_state = {
+                key: value[begin:stop] if torch.is_tensor(value) else value
+                for key, value in state.items()
+            }
+            for key in scalars:
+                run_state[key] = state[key][start]
+
+            yield (
+                self.data[begin:stop],
+                self.grad[begin:stop],
+                run_state,
+                self.numels[start:end],
+            )
+
+            for key in scalars:
+                state[key][start:end] = [run_state[key]] * (end - start)
+
+            start = end
+
+
+def flatten_group(group):
+    """Packs the parameters of a group into one FlatBuffer per device and
+    dtype. Parameters that do not require gradients are left out."""
+    params = [p for p in group['params'] if p.requires_grad]
+
+    return [
+        FlatBuffer([params[i] for i in indices]) for indices in group_tensors(params)
+    ]
+
+
+class GradBucket:
+    """Keeps gradients of parameters of one device and dtype as views into a
+    persistent flat buffer, so they can be zeroed with a single memset.
+
+    Autograd accumulates into existing gradients in place, so the views stay
+    valid across steps. Gradients that were replaced (e.g. set to None) are
+    pointed back to the buffer by ``zero_``.
+
+    As every parameter always has a gradient, ``release`` sets the gradients
+    of parameters that autograd did not reach since the last ``zero_`` back
+    to None before an update, so optimizers skip them (and e.g. do not apply
+    weight decay to them) as they would without buckets.
+    """
+
+    def __init__(self, params):
+        self.params = params
+        self.grad = torch.zeros(
+            sum(p.numel() for p in params),
+            dtype=params[0].dtype,
+            device=params[0].device,
+        )
+        self.grads = [
+            view.view_as(p)
+            for view, p in zip(self.grad.split([p.numel() for p in params]), params)
+        ]
+
+        self.reached = set()
+        self.handles = []
+
+        for i, (p, grad) in enumerate(zip(params, self.grads)):
+            if p.grad is not None:
+                grad.copy_(p.grad.data)
+                self.reached.add(i)
+
+            p.grad = grad
+            self.handles.append(p.register_hook(partial(self.reach, i)))
+
+    def reach(self, i, grad):
+        self.reached.add(i)
+
+    def release(self):
+        for i, p in enumerate(self.params):
+            if i not in self.reached:
+                p.grad = None
+
+    def zero_(self):
+        self.grad.zero_()
+        self.reached.clear()
+
+        for p, grad in zip(self.params, self.grads):
+            if p.grad is not grad:
+                p.grad = grad
+
+
+def grad_buckets(params, bucket_size):
+    """Splits params into GradBuckets per device and dtype, each holding at most
+    bucket_size elements unless a single parameter is larger."""
+    buckets = []
+
+    for indices in group_tensors(params):
+        bucket, numel = [], 0
+
+        for i in indices:
+            if bucket and numel + params[i].numel() > bucket_size:
+                buckets.append(GradBucket(bucket))
+                bucket, numel = [], 0
+
+            bucket.append(params[i])
+            numel += params[i].numel()
+
+        buckets.append(GradBucket(bucket))
+
+    return buckets
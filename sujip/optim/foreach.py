@@ -0,0 +1,20 @@
+from collections import OrderedDict
+
+
+def group_tensors(tensors, key=None):
+    """Groups indices of tensors that can be updated with the same foreach ops.
+
+    Tensors are grouped by device and dtype, and additionally by key(index) if
+    it is given.
+    """
+    groups = OrderedDict()
+
+    for i, tensor in enumerate(tensors):
+        group_key = tensor.device, tensor.dtype
+
+        if key is not None:
+            group_key = group_key + (key(i),)
+
+        groups.setdefault(group_key, []).append(i)
+
+    return list(groups.values())
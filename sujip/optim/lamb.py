@@ -7,6 +7,15 @@ import math
 import torch
 from torch.optim import Optimizer
 
+from .flat import flatten_group
+from .foreach import group_tensors
+from .precision import check_precision, restore_state, update_master
+
+
+def trust_ratio(r1, r2):
+    # Computed on device so that steps never wait for a host sync
+    return torch.where((r1 < 1e-7) | (r2 < 1e-7), torch.ones_like(r1), r1 / r2)
+
 
 class LAMB(Optimizer):
     r"""Implements LAMB algorithm.
@@ -25,6 +34,22 @@ class LAMB(Optimizer):
         amsgrad (boolean, optional): whether to use the AMSGrad variant of this
             algorithm from the paper `On the Convergence of Adam and Beyond`_
             (default: False)
+        foreach (boolean, optional): whether to update parameters of the same
+            device and dtype together with multi-tensor foreach ops
+            (default: False)
+        flat (boolean, optional): whether to pack parameters, gradients and
+            state of the same device and dtype into contiguous flat buffers,
+            exposing parameters as views into them. Parameters that do not
+            require gradients are not packed, and parameters without gradient
+            are skipped as on the per-parameter path. Takes precedence over
+            foreach (default: False)
+        master_weights (boolean, optional): whether to keep fp32 master
+            copies of the parameters and update them in fp32. Only supported
+            without foreach and flat (default: False)
+        state_precision (str, optional): precision of the moment estimates,
+            either 'bf16' or '8bit' for block-wise quantization. If None they
+            are kept in the parameter dtype, or in fp32 with master_weights.
+            Only supported without foreach and flat (default: None)
 
     .. _Reducing BERT Pre-Training Time from 3 Days to 76 Minutes
         https://arxiv.org/abs/1904.00962
@@ -38,6 +63,10 @@ class LAMB(Optimizer):
         eps=1e-8,
         weight_decay=0,
         amsgrad=False,
+        foreach=False,
+        flat=False,
+        master_weights=False,
+        state_precision=None,
     ):
         if not 0.0 <= lr:
             raise ValueError("Invalid learning rate: {}".format(lr))
@@ -48,14 +77,165 @@ class LAMB(Optimizer):
         if not 0.0 <= betas[1] < 1.0:
             raise ValueError("Invalid beta parameter at index 1: {}".format(betas[1]))
         defaults = dict(
-            lr=lr, betas=betas, eps=eps, weight_decay=weight_decay, amsgrad=amsgrad
+            lr=lr,
+            betas=betas,
+            eps=eps,
+            weight_decay=weight_decay,
+            amsgrad=amsgrad,
+            foreach=foreach,
+            flat=flat,
+            master_weights=master_weights,
+            state_precision=state_precision,
         )
+        check_precision(master_weights, state_precision, foreach, flat)
         super(LAMB, self).__init__(params, defaults)
 
+        self.flat_buffers = {}
+
     def __setstate__(self, state):
         super(LAMB, self).__setstate__(state)
         for group in self.param_groups:
             group.setdefault('amsgrad', False)
+            group.setdefault('foreach', False)
+            group.setdefault('flat', False)
+            group.setdefault('master_weights', False)
+            group.setdefault('state_precision', None)
+
+        self.flat_buffers = {}
+
+    def load_state_dict(self, state_dict):
+        super(LAMB, self).load_state_dict(state_dict)
+        restore_state(self, state_dict)
+
+    def init_state(self, p, amsgrad, key=None):
+        state = self.state[p if key is None else key]
+
+        # State initialization
+        if len(state) == 0:
+            state['step'] = 0
+            # Exponential moving average of gradient values
+            state['exp_avg'] = torch.zeros_like(p.data)
+            # Exponential moving average of squared gradient values
+            state['exp_avg_sq'] = torch.zeros_like(p.data)
+            if amsgrad:
+                # Maintains max of all exp. moving avg. of sq. grad. values
+                state['max_exp_avg_sq'] = torch.zeros_like(p.data)
+
+        return state
+
+    def step_foreach(self, group):
+        params = [p for p in group['params'] if p.grad is not None]
+        amsgrad = group['amsgrad']
+        beta1, beta2 = group['betas']
+
+        for p in params:
+            if p.grad.data.is_sparse:
+                raise RuntimeError(
+                    'LAMB does not support sparse gradients, please consider SparseAdam instead'
+                )
+
+        for indices in group_tensors(params):
+            group_params = [params[i].data for i in indices]
+            grads = [params[i].grad.data for i in indices]
+            states = [self.init_state(params[i], amsgrad) for i in indices]
+            exp_avgs = [state['exp_avg'] for state in states]
+            exp_avg_sqs = [state['exp_avg_sq'] for state in states]
+
+            for state in states:
+                state['step'] += 1
+
+            torch._foreach_mul_(exp_avgs, beta1)
+            torch._foreach_add_(exp_avgs, grads, alpha=1 - beta1)
+            torch._foreach_mul_(exp_avg_sqs, beta2)
+            torch._foreach_addcmul_(exp_avg_sqs, grads, grads, value=1 - beta2)
+
+            if amsgrad:
+                max_exp_avg_sqs = [state['max_exp_avg_sq'] for state in states]
+                torch._foreach_maximum_(max_exp_avg_sqs, exp_avg_sqs)
+                denoms = torch._foreach_sqrt(max_exp_avg_sqs)
+            else:
+                denoms = torch._foreach_sqrt(exp_avg_sqs)
+
+            torch._foreach_add_(denoms, group['eps'])
+
+            steps = torch._foreach_div(exp_avgs, denoms)
+            torch._foreach_mul_(
+                steps,
+                [
+                    math.sqrt(1 - beta2 ** state['step'])
+                    * 1
+                    / (1 - beta1 ** state['step'])
+                    for state in states
+                ],
+            )
+
+            if group['weight_decay'] != 0:
+                torch._foreach_add_(steps, group_params, alpha=group['weight_decay'])
+
+            r1 = torch.stack(torch._foreach_norm(group_params))
+            r2 = torch.stack(torch._foreach_norm(steps))
+
+            torch._foreach_mul_(steps, list(trust_ratio(r1, r2).unbind(0)))
+            torch._foreach_add_(group_params, steps, alpha=-group['lr'])
+
+    def step_flat(self, index, group):
+        if index not in self.flat_buffers:
+            self.flat_buffers[index] = flatten_group(group)
+
+        for i, buffer in enumerate(self.flat_buffers[index]):
+            state = self.init_state(
+                buffer.data, group['amsgrad'], key=f'flat_{index}_{i}'
+            )
+            buffer.gather_grads()
+
+            for data, grad, run_state, numels in buffer.segments(state, ('step',)):
+                self.update(data, grad, run_state, group, numels)
+
+    def update(self, data, grad, state, group, numels=None):
+        amsgrad = group['amsgrad']
+        exp_avg, exp_avg_sq = state['exp_avg'], state['exp_avg_sq']
+        if amsgrad:
+            max_exp_avg_sq = state['max_exp_avg_sq']
+        beta1, beta2 = group['betas']
+
+        state['step'] += 1
+
+        # if group['weight_decay'] != 0:
+        #     grad.add_(group['weight_decay'], data)
+
+        # Decay the first and second moment running average coefficient
+        exp_avg.mul_(beta1).add_(1 - beta1, grad)
+        exp_avg_sq.mul_(beta2).addcmul_(1 - beta2, grad, grad)
+        if amsgrad:
+            # Maintains the maximum of all 2nd moment running avg. till now
+            torch.max(max_exp_avg_sq, exp_avg_sq, out=max_exp_avg_sq)
+            # Use the max. for normalizing running avg. of gradient
+            denom = max_exp_avg_sq.sqrt().add_(group['eps'])
+        else:
+            denom = exp_avg_sq.sqrt().add_(group['eps'])
+
+        bias_correction1 = 1 - beta1 ** state['step']
+        bias_correction2 = 1 - beta2 ** state['step']
+
+        step = exp_avg.div(denom).mul_(
+            math.sqrt(bias_correction2) * 1 / bias_correction1
+        )
+
+        if group['weight_decay'] != 0:
+            step.add_(group['weight_decay'], data)
+
+        if numels is None:
+            step.mul_(trust_ratio(data.norm(), step.norm()))
+
+        else:
+            # Trust ratios are per parameter, so they are computed over the
+            # segments of the flat buffers
+            datas, steps = list(data.split(numels)), list(step.split(numels))
+            r1 = torch.stack(torch._foreach_norm(datas))
+            r2 = torch.stack(torch._foreach_norm(steps))
+            torch._foreach_mul_(steps, list(trust_ratio(r1, r2).unbind(0)))
+
+        data.add_(step, alpha=-group['lr'])
 
     def step(self, closure=None):
         """Performs a single optimization step.
@@ -68,7 +248,17 @@ class LAMB(Optimizer):
         if closure is not None:
             loss = closure()
 
-        for group in self.param_groups:
+        for index, group in enumerate(self.param_groups):
+            if group['flat']:
+                self.step_flat(index, group)
+
+                continue
+
+            if group['foreach']:
+                self.step_foreach(group)
+
+                continue
+
             for p in group['params']:
                 if p.grad is None:
                     continue
@@ -79,61 +269,12 @@ class LAMB(Optimizer):
                     )
                 amsgrad = group['amsgrad']
 
-                state = self.state[p]
+                state = self.init_state(p, amsgrad)
 
-                # State initialization
-                if len(state) == 0:
-                    state['step'] = 0
-                    # Exponential moving average of gradient values
-                    state['exp_avg'] = torch.zeros_like(p.data)
-                    # Exponential moving average of squared gradient values
-                    state['exp_avg_sq'] = torch.zeros_like(p.data)
-                    if amsgrad:
-                        # Maintains max of all exp. moving avg. of sq. grad. values
-                        state['max_exp_avg_sq'] = torch.zeros_like(p.data)
+                if group['master_weights'] or group['state_precision'] is not None:
+                    update_master(self.update, state, p, grad, group)
 
-                exp_avg, exp_avg_sq = state['exp_avg'], state['exp_avg_sq']
-                if amsgrad:
-                    max_exp_avg_sq = state['max_exp_avg_sq']
-                beta1, beta2 = group['betas']
-
-                state['step'] += 1
-
-                # if group['weight_decay'] != 0:
-                #     grad.add_(group['weight_decay'], p.data)
-
-                # Decay the first and second moment running average coefficient
-                exp_avg.mul_(beta1).add_(1 - beta1, grad)
-                exp_avg_sq.mul_(beta2).addcmul_(1 - beta2, grad, grad)
-                if amsgrad:
-                    # Maintains the maximum of all 2nd moment running avg. till now
-                    torch.max(max_exp_avg_sq, exp_avg_sq, out=max_exp_avg_sq)
-                    # Use the max. for normalizing running avg. of gradient
-                    denom = max_exp_avg_sq.sqrt().add_(group['eps'])
                 else:
-                    denom = exp_avg_sq.sqrt().add_(group['eps'])
-
-                bias_correction1 = 1 - beta1 ** state['step']
-                bias_correction2 = 1 - beta2 ** state['step']
-
-                r1 = p.data.norm().item()
-                step = exp_avg.div(denom).mul_(
-                    math.sqrt(bias_correction2) * 1 / bias_correction1
-                )
-
-                if group['weight_decay'] != 0:
-                    step.add_(group['weight_decay'], p.data)
-
-                r2 = step.norm().item()
-
-                if r1 < 1e-7 or r2 < 1e-7:
-                    r = 1
-
-                else:
-                    r = r1 / r2
-
-                lr = group['lr'] * r.item()
-
-                p.data.add_(-lr, step)
+                    self.update(p.data, grad, state, group)
 
         return loss
@@ -82,7 +82,7 @@ class AdamWArgs:
 class LAMBArgs:
     @classmethod
     def invoke(cls, args):
-        return lambda parameters: optim.LAMB(parameters, **cls.get_args(args))
+        return lambda parameters: LAMB(parameters, **cls.get_args(args))
 
     @staticmethod
     def add_args(parser):
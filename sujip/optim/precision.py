@@ -0,0 +1,142 @@
+import torch
+import torch.nn.functional as F
+
+STATE_PRECISIONS = (None, 'bf16', '8bit')
+
+
+BLOCK_SIZE = 256
+
+
+def quantize_blocks(tensor, sqrt=False, block_size=BLOCK_SIZE):
+    """8-bit block-wise quantization of a tensor into codes and scales.
+
+    Every block of ``block_size`` elements is scaled by its absolute maximum,
+    so the error of an element is bounded by 1/254 of its block maximum. With
+    ``sqrt=True`` a non-negative tensor is quantized after a square root, which
+    spreads small values such as second moments over more codes, and codes are
+    rounded up so that no nonzero value is stored as zero.
+    """
+    numel = tensor.numel()
+    flat = tensor.detach().reshape(-1).float()
+    if sqrt:
+        flat = flat.sqrt()
+
+    blocks = F.pad(flat, (0, -numel % block_size)).view(-1, block_size)
+    tiny = torch.finfo(torch.float32).tiny
+
+    if sqrt:
+        scale = blocks.amax(1, keepdim=True).div_(255)
+        codes = blocks.div(scale.clamp_min(tiny)).ceil_().clamp_(0, 255)
+
+        return codes.to(torch.uint8), scale
+
+    scale = blocks.abs().amax(1, keepdim=True).div_(127)
+    codes = blocks.div(scale.clamp_min(tiny)).round_()
+
+    return codes.to(torch.int8), scale
+
+
+def dequantize_blocks(codes, scale, shape, sqrt=False):
+    values = codes.float().mul_(scale)
+    if sqrt:
+        values.square_()
+
+    return values.view(-1)[: shape.numel()].view(shape)
+
+
+def load_state(state, shape):
+    values = {}
+
+    for key, value in state.items():
+        if key == 'master' or key.endswith('_scale'):
+            continue
+
+        if key.endswith('_codes'):
+            key = key[: -len('_codes')]
+            values[key] = dequantize_blocks(
+                value, state[key + '_scale'], shape, sqrt=key.endswith('_sq')
+            )
+
+        elif torch.is_tensor(value) and value.is_floating_point():
+            values[key] = value.float()
+
+        else:
+            values[key] = value
+
+    return values
+
+
+def store_state(state, values, precision):
+    for key, value in values.items():
+        if not torch.is_tensor(value) or not value.is_floating_point():
+            state[key] = value
+
+        elif precision == '8bit':
+            # Second moments are stored as their square root
+            codes, scale = quantize_blocks(value, sqrt=key.endswith('_sq'))
+            state.pop(key, None)
+            state[key + '_codes'] = codes
+            state[key + '_scale'] = scale
+
+        elif precision == 'bf16':
+            state[key] = value.to(torch.bfloat16)
+
+        else:
+            state[key] = value
+
+
+def check_precision(master_weights, state_precision, foreach, flat):
+    if state_precision not in STATE_PRECISIONS:
+        raise ValueError("Invalid state precision: {}".format(state_precision))
+
+    if (master_weights or state_precision is not None) and (foreach or flat):
+        raise ValueError(
+            "master_weights and state_precision are not supported with foreach or flat"
+        )
+
+
+def update_master(update, state, p, grad, group):
+    """Runs ``update`` in fp32 on the master weights and dequantized state of p.
+
+    With ``master_weights`` the fp32 copy of p is kept in ``state['master']``
+    and copied back to p after the update. State tensors are stored back in
+    ``state_precision``, or in fp32 if it is None. 8-bit state is kept as
+    plain tensors of codes and block scales under ``<key>_codes`` and
+    ``<key>_scale``, so state dicts load with ``weights_only=True``.
+    """
+    data = p.data
+
+    if group['master_weights']:
+        if 'master' not in state:
+            state['master'] = p.data.float()
+
+        data, grad = state['master'], grad.float()
+
+    values = load_state(state, p.shape)
+
+    update(data, grad, values, group)
+
+    store_state(state, values, group['state_precision'])
+
+    if data is not p.data:
+        p.data.copy_(data)
+
+
+def restore_state(optimizer, state_dict):
+    """Restores the saved dtype of state of groups using master weights or
+    reduced state precision.
+
+    Optimizer.load_state_dict casts floating point state to the dtype of its
+    parameter, which would truncate fp32 master weights and moments of low
+    precision parameters.
+    """
+    saved_groups = state_dict['param_groups']
+
+    for group, saved_group in zip(optimizer.param_groups, saved_groups):
+        if not group['master_weights'] and group['state_precision'] is None:
+            continue
+
+        for p, index in zip(group['params'], saved_group['params']):
+            for key, value in state_dict['state'].get(index, {}).items():
+                if torch.is_tensor(value) and value.is_floating_point():
+                    optimizer.state[p][key] = value.to(device=p.device, copy=True)
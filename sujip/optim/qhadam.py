@@ -6,6 +6,10 @@
 import torch
 from torch.optim.optimizer import Optimizer
 
+from .flat import flatten_group
+from .foreach import group_tensors
+from .precision import check_precision, restore_state, update_master
+
 
 class QHAdam(Optimizer):
     r"""Implements the QHAdam optimization algorithm `(Ma and Yarats, 2019)`_.
@@ -31,6 +35,22 @@ class QHAdam(Optimizer):
         weight_decay (float, optional): weight decay
             (L2 regularlization coefficient, times two)
             (default: 0.0)
+        foreach (bool, optional): whether to update parameters of the same
+            device and dtype together with multi-tensor foreach ops
+            (default: False)
+        flat (bool, optional): whether to pack parameters, gradients and
+            state of the same device and dtype into contiguous flat buffers,
+            exposing parameters as views into them. Parameters that do not
+            require gradients are not packed, and parameters without gradient
+            are skipped as on the per-parameter path. Takes precedence over
+            foreach (default: False)
+        master_weights (bool, optional): whether to keep fp32 master
+            copies of the parameters and update them in fp32. Only supported
+            without foreach and flat (default: False)
+        state_precision (str, optional): precision of the moment estimates,
+            either 'bf16' or '8bit' for block-wise quantization. If None they
+            are kept in the parameter dtype, or in fp32 with master_weights.
+            Only supported without foreach and flat (default: None)
 
     Example:
         >>> optimizer = qhoptim.pyt.QHAdam(
@@ -51,6 +71,10 @@ class QHAdam(Optimizer):
         nus=(1.0, 1.0),
         weight_decay=0.0,
         eps=1e-8,
+        foreach=False,
+        flat=False,
+        master_weights=False,
+        state_precision=None,
     ):
         if not 0.0 <= lr:
             raise ValueError("Invalid learning rate: {}".format(lr))
@@ -69,9 +93,147 @@ class QHAdam(Optimizer):
             "nus": nus,
             "weight_decay": weight_decay,
             "eps": eps,
+            "foreach": foreach,
+            "flat": flat,
+            "master_weights": master_weights,
+            "state_precision": state_precision,
         }
+        check_precision(master_weights, state_precision, foreach, flat)
         super(QHAdam, self).__init__(params, defaults)
 
+        self.flat_buffers = {}
+
+    def __setstate__(self, state):
+        super(QHAdam, self).__setstate__(state)
+        for group in self.param_groups:
+            group.setdefault("foreach", False)
+            group.setdefault("flat", False)
+            group.setdefault("master_weights", False)
+            group.setdefault("state_precision", None)
+
+        self.flat_buffers = {}
+
+    def load_state_dict(self, state_dict):
+        super(QHAdam, self).load_state_dict(state_dict)
+        restore_state(self, state_dict)
+
+    def init_state(self, p, key=None):
+        param_state = self.state[p if key is None else key]
+
+        if len(param_state) == 0:
+            param_state["beta1_weight"] = 0.0
+            param_state["beta2_weight"] = 0.0
+            param_state["exp_avg"] = torch.zeros_like(p.data)
+            param_state["exp_avg_sq"] = torch.zeros_like(p.data)
+
+        return param_state
+
+    def step_foreach(self, group):
+        lr = group["lr"]
+        beta1, beta2 = group["betas"]
+        nu1, nu2 = group["nus"]
+        weight_decay = group["weight_decay"]
+        eps = group["eps"]
+
+        params = [p for p in group["params"] if p.grad is not None]
+
+        for p in params:
+            if p.grad.data.is_sparse:
+                raise RuntimeError("QHAdam does not support sparse gradients")
+
+        param_states = [self.init_state(p) for p in params]
+
+        for param_state in param_states:
+            param_state["beta1_weight"] = 1.0 + beta1 * param_state["beta1_weight"]
+            param_state["beta2_weight"] = 1.0 + beta2 * param_state["beta2_weight"]
+
+        # Moment updates take scalar weights, so parameters that have been
+        # stepped a different number of times are updated separately
+        def weights(i):
+            return param_states[i]["beta1_weight"], param_states[i]["beta2_weight"]
+
+        for indices in group_tensors(params, key=weights):
+            group_params = [params[i].data for i in indices]
+            d_ps = [params[i].grad.data for i in indices]
+            exp_avgs = [param_states[i]["exp_avg"] for i in indices]
+            exp_avg_sqs = [param_states[i]["exp_avg_sq"] for i in indices]
+            beta1_weight, beta2_weight = weights(indices[0])
+
+            if weight_decay != 0:
+                torch._foreach_add_(d_ps, group_params, alpha=weight_decay)
+
+            d_p_sqs = torch._foreach_mul(d_ps, d_ps)
+
+            beta1_adj = 1.0 - (1.0 / beta1_weight)
+            beta2_adj = 1.0 - (1.0 / beta2_weight)
+            torch._foreach_mul_(exp_avgs, beta1_adj)
+            torch._foreach_add_(exp_avgs, d_ps, alpha=1.0 - beta1_adj)
+            torch._foreach_mul_(exp_avg_sqs, beta2_adj)
+            torch._foreach_add_(exp_avg_sqs, d_p_sqs, alpha=1.0 - beta2_adj)
+
+            avg_grads = torch._foreach_mul(exp_avgs, nu1)
+            if nu1 != 1.0:
+                torch._foreach_add_(avg_grads, d_ps, alpha=1.0 - nu1)
+
+            avg_grad_rmss = torch._foreach_mul(exp_avg_sqs, nu2)
+            if nu2 != 1.0:
+                torch._foreach_add_(avg_grad_rmss, d_p_sqs, alpha=1.0 - nu2)
+            torch._foreach_sqrt_(avg_grad_rmss)
+            if eps != 0.0:
+                torch._foreach_add_(avg_grad_rmss, eps)
+
+            torch._foreach_addcdiv_(group_params, avg_grads, avg_grad_rmss, value=-lr)
+
+    def update(self, data, d_p, param_state, group):
+        lr = group["lr"]
+        beta1, beta2 = group["betas"]
+        nu1, nu2 = group["nus"]
+        weight_decay = group["weight_decay"]
+        eps = group["eps"]
+
+        if weight_decay != 0:
+            d_p.add_(weight_decay, data)
+
+        d_p_sq = d_p.mul(d_p)
+
+        param_state["beta1_weight"] = 1.0 + beta1 * param_state["beta1_weight"]
+        param_state["beta2_weight"] = 1.0 + beta2 * param_state["beta2_weight"]
+
+        beta1_weight = param_state["beta1_weight"]
+        beta2_weight = param_state["beta2_weight"]
+        exp_avg = param_state["exp_avg"]
+        exp_avg_sq = param_state["exp_avg_sq"]
+
+        beta1_adj = 1.0 - (1.0 / beta1_weight)
+        beta2_adj = 1.0 - (1.0 / beta2_weight)
+        exp_avg.mul_(beta1_adj).add_(1.0 - beta1_adj, d_p)
+        exp_avg_sq.mul_(beta2_adj).add_(1.0 - beta2_adj, d_p_sq)
+
+        avg_grad = exp_avg.mul(nu1)
+        if nu1 != 1.0:
+            avg_grad.add_(1.0 - nu1, d_p)
+
+        avg_grad_rms = exp_avg_sq.mul(nu2)
+        if nu2 != 1.0:
+            avg_grad_rms.add_(1.0 - nu2, d_p_sq)
+        avg_grad_rms.sqrt_()
+        if eps != 0.0:
+            avg_grad_rms.add_(eps)
+
+        data.addcdiv_(-lr, avg_grad, avg_grad_rms)
+
+    def step_flat(self, index, group):
+        if index not in self.flat_buffers:
+            self.flat_buffers[index] = flatten_group(group)
+
+        for i, buffer in enumerate(self.flat_buffers[index]):
+            param_state = self.init_state(buffer.data, key=f"flat_{index}_{i}")
+            buffer.gather_grads()
+            segments = buffer.segments(param_state, ("beta1_weight", "beta2_weight"))
+
+            for data, grad, run_state, _ in segments:
+                self.update(data, grad, run_state, group)
+
     def step(self, closure=None):
         """Performs a single optimization step.
 
@@ -83,12 +245,16 @@ class QHAdam(Optimizer):
         if closure is not None:
             loss = closure()
 
-        for group in self.param_groups:
-            lr = group["lr"]
-            beta1, beta2 = group["betas"]
-            nu1, nu2 = group["nus"]
-            weight_decay = group["weight_decay"]
-            eps = group["eps"]
+        for index, group in enumerate(self.param_groups):
+            if group["flat"]:
+                self.step_flat(index, group)
+
+                continue
+
+            if group["foreach"]:
+                self.step_foreach(group)
+
+                continue
 
             for p in group["params"]:
                 if p.grad is None:
@@ -98,44 +264,13 @@ class QHAdam(Optimizer):
                 if d_p.is_sparse:
                     raise RuntimeError("QHAdam does not support sparse gradients")
 
-                param_state = self.state[p]
-
-                if weight_decay != 0:
-                    d_p.add_(weight_decay, p.data)
-
-                d_p_sq = d_p.mul(d_p)
-
-                if len(param_state) == 0:
-                    param_state["beta1_weight"] = 0.0
-                    param_state["beta2_weight"] = 0.0
-                    param_state["exp_avg"] = torch.zeros_like(p.data)
-                    param_state["exp_avg_sq"] = torch.zeros_like(p.data)
-
-                param_state["beta1_weight"] = 1.0 + beta1 * param_state["beta1_weight"]
-                param_state["beta2_weight"] = 1.0 + beta2 * param_state["beta2_weight"]
-
-                beta1_weight = param_state["beta1_weight"]
-                beta2_weight = param_state["beta2_weight"]
-                exp_avg = param_state["exp_avg"]
-                exp_avg_sq = param_state["exp_avg_sq"]
-
-                beta1_adj = 1.0 - (1.0 / beta1_weight)
-                beta2_adj = 1.0 - (1.0 / beta2_weight)
-                exp_avg.mul_(beta1_adj).add_(1.0 - beta1_adj, d_p)
-                exp_avg_sq.mul_(beta2_adj).add_(1.0 - beta2_adj, d_p_sq)
-
-                avg_grad = exp_avg.mul(nu1)
-                if nu1 != 1.0:
-                    avg_grad.add_(1.0 - nu1, d_p)
+                param_state = self.init_state(p)
 
-                avg_grad_rms = exp_avg_sq.mul(nu2)
-                if nu2 != 1.0:
-                    avg_grad_rms.add_(1.0 - nu2, d_p_sq)
-                avg_grad_rms.sqrt_()
-                if eps != 0.0:
-                    avg_grad_rms.add_(eps)
+                if group["master_weights"] or group["state_precision"] is not None:
+                    update_master(self.update, param_state, p, d_p, group)
 
-                p.data.addcdiv_(-lr, avg_grad, avg_grad_rms)
+                else:
+                    self.update(p.data, d_p, param_state, group)
 
         return loss
 
@@ -1,9 +1,21 @@
 from math import cos, pi, floor, sin
 
+import numpy as np
 from torch.optim import lr_scheduler
 
 
-class CosineLR(lr_scheduler._LRScheduler):
+class LRTable:
+    # lr_table(steps) computes the learning rates a scheduler sets on its
+    # updates ``steps`` with NumPy, without touching its counters. For PyTorch
+    # schedulers the constructor is update 0, so lr_at(t) is the learning rate
+    # after t calls of step(); for the others it is the learning rate set by
+    # the (t + 1)-th call of step().
+
+    def lr_at(self, step):
+        return float(self.lr_table(np.array([step]))[0])
+
+
+class CosineLR(LRTable, lr_scheduler._LRScheduler):
     def __init__(self, optimizer, lr_min, lr_max, step_size):
         self.lr_min = lr_min
         self.lr_max = lr_max
@@ -23,8 +35,15 @@ class CosineLR(lr_scheduler._LRScheduler):
 
         return [lr for base_lr in self.base_lrs]
 
+    def lr_table(self, steps):
+        iteration = np.asarray(steps) % self.step_size
+
+        return self.lr_min + 0.5 * (self.lr_max - self.lr_min) * (
+            1 + np.cos(iteration / self.step_size * pi)
+        )
+
 
-class PowerLR(lr_scheduler._LRScheduler):
+class PowerLR(LRTable, lr_scheduler._LRScheduler):
     def __init__(self, optimizer, lr_min, lr_max, warmup):
         self.lr_min = lr_min
         self.lr_max = lr_max
@@ -46,8 +65,17 @@ class PowerLR(lr_scheduler._LRScheduler):
 
         return [lr for base_lr in self.base_lrs]
 
+    def lr_table(self, steps):
+        iteration = np.asarray(steps, dtype=np.float64)
+        warmup = (
+            self.lr_min + (self.lr_max - self.lr_min) / max(self.warmup, 1) * iteration
+        )
+        decay = self.lr_max * np.maximum(iteration - self.warmup + 1, 1) ** -0.5
+
+        return np.where(iteration < self.warmup, warmup, decay)
+
 
-class SineLR(lr_scheduler._LRScheduler):
+class SineLR(LRTable, lr_scheduler._LRScheduler):
     def __init__(self, optimizer, lr_min, lr_max, step_size):
         self.lr_min = lr_min
         self.lr_max = lr_max
@@ -67,8 +95,15 @@ class SineLR(lr_scheduler._LRScheduler):
 
         return [lr for base_lr in self.base_lrs]
 
+    def lr_table(self, steps):
+        iteration = np.asarray(steps) % self.step_size
+
+        return self.lr_min + (self.lr_max - self.lr_min) * np.sin(
+            iteration / self.step_size * pi
+        )
+
 
-class LinearLR(lr_scheduler._LRScheduler):
+class LinearLR(LRTable, lr_scheduler._LRScheduler):
     def __init__(self, optimizer, lr_min, lr_max, warmup, step_size):
         self.lr_min = lr_min
         self.lr_max = lr_max
@@ -93,8 +128,16 @@ class LinearLR(lr_scheduler._LRScheduler):
 
         return [lr for base_lr in self.base_lrs]
 
+    def lr_table(self, steps):
+        iteration = np.asarray(steps) % self.step_size
+        decay = self.lr_max + (iteration - self.warmup) * (
+            self.lr_min - self.lr_max
+        ) / max(self.step_size - self.warmup, 1)
 
-class CLR(lr_scheduler._LRScheduler):
+        return np.where(iteration < self.warmup, float(self.lr_max), decay)
+
+
+class CLR(LRTable, lr_scheduler._LRScheduler):
     def __init__(self, optimizer, lr_min, lr_max, step_size):
         self.epoch = 0
         self.lr_min = lr_min
@@ -114,8 +157,15 @@ class CLR(lr_scheduler._LRScheduler):
 
         return [lr for base_lr in self.base_lrs]
 
+    def lr_table(self, steps):
+        epoch = np.asarray(steps, dtype=np.float64)
+        cycle = np.floor(1 + epoch / (2 * self.step_size))
+        x = np.abs(epoch / self.step_size - 2 * cycle + 1)
+
+        return self.lr_min + (self.lr_max - self.lr_min) * np.maximum(0, 1 - x)
 
-class Warmup(lr_scheduler._LRScheduler):
+
+class Warmup(LRTable, lr_scheduler._LRScheduler):
     def __init__(self, optimizer, model_dim, factor=1, warmup=16000):
         self.optimizer = optimizer
         self.model_dim = model_dim
@@ -135,6 +185,16 @@ class Warmup(lr_scheduler._LRScheduler):
 
         return [lr for base_lr in self.base_lrs]
 
+    def lr_table(self, steps):
+        # The counter is incremented before the learning rate is computed
+        iteration = np.asarray(steps, dtype=np.float64) + 1
+
+        return (
+            self.factor
+            * self.model_dim ** (-0.5)
+            * np.minimum(iteration ** (-0.5), iteration * self.warmup ** (-1.5))
+        )
+
 
 # Copyright 2019 fastai
 
@@ -154,7 +214,7 @@ class Warmup(lr_scheduler._LRScheduler):
 # Taken from fastai and changed to make it runs like PyTorch lr scheduler
 
 
-class CycleAnnealScheduler:
+class CycleAnnealScheduler(LRTable):
     def __init__(
         self, optimizer, lr_max, lr_divider, cut_point, step_size, momentum=None
     ):
@@ -184,6 +244,22 @@ class CycleAnnealScheduler:
 
         return lr
 
+    def lr_table(self, steps):
+        iteration = np.asarray(steps) % self.step_size
+        cycle_step = self.cycle_step
+
+        cut = (iteration - 2 * cycle_step) / (self.step_size - 2 * cycle_step)
+        anneal = self.lr_max * (1 + (cut * (1 - 100) / 100)) / self.lr_divider
+
+        cut = np.where(
+            iteration > cycle_step,
+            1 - (iteration - cycle_step) / cycle_step,
+            iteration / cycle_step,
+        )
+        cycle = self.lr_max * (1 + cut * (self.lr_divider - 1)) / self.lr_divider
+
+        return np.where(iteration > 2 * cycle_step, anneal, cycle)
+
     def get_momentum(self):
         if self.iteration > 2 * self.cycle_step:
             momentum = self.momentum[0]
@@ -223,7 +299,7 @@ def anneal_linear(start, end, proportion):
 
 
 def anneal_cos(start, end, proportion):
-    cos_val = cos(pi * proportion) + 1
+    cos_val = np.cos(pi * proportion) + 1
 
     return end + (start - end) / 2 * cos_val
 
@@ -248,7 +324,7 @@ class Phase:
         return self.n >= self.n_iter
 
 
-class CycleScheduler:
+class CycleScheduler(LRTable):
     def __init__(
         self,
         optimizer,
@@ -319,8 +395,24 @@ class CycleScheduler:
 
         return lr, momentum
 
+    def lr_table(self, steps):
+        # Phases run one after another and restart after the last one, and
+        # the phase counter is incremented before annealing
+        iteration = np.asarray(steps) % sum(phase.n_iter for phase in self.lr_phase)
+        lrs = np.empty(iteration.shape)
+        offset = 0
+
+        for phase in self.lr_phase:
+            mask = (iteration >= offset) & (iteration < offset + phase.n_iter)
+            lrs[mask] = phase.anneal_fn(
+                phase.start, phase.end, (iteration[mask] - offset + 1) / phase.n_iter
+            )
+            offset += phase.n_iter
+
+        return lrs
+
 
-class LRFinder(lr_scheduler._LRScheduler):
+class LRFinder(LRTable, lr_scheduler._LRScheduler):
     def __init__(self, optimizer, lr_min, lr_max, step_size, linear=False):
         ratio = lr_max / lr_min
         self.linear = linear
@@ -345,6 +437,14 @@ class LRFinder(lr_scheduler._LRScheduler):
 
         return [lr for base_lr in self.base_lrs]
 
+    def lr_table(self, steps):
+        iteration = np.asarray(steps, dtype=np.float64)
+
+        if self.linear:
+            return self.lr_min + self.lr_mult * iteration
+
+        return self.lr_min * self.lr_mult ** iteration
+
     def record(self, loss):
         self.losses.append(loss)
 
@@ -352,3 +452,33 @@ class LRFinder(lr_scheduler._LRScheduler):
         with open(filename, 'w') as f:
             for lr, loss in zip(self.lrs, self.losses):
                 f.write('{},{}\n'.format(lr, loss))
+
+
+class TableLR(LRTable, lr_scheduler._LRScheduler):
+    """Looks learning rates up in a precomputed table, e.g.
+    ``TableLR(optimizer, scheduler.lr_table(np.arange(n)))``.
+
+    After the end of the table the last learning rate is kept, or the table
+    restarts if ``wrap`` is True.
+    """
+
+    def __init__(self, optimizer, table, wrap=False):
+        self.table = np.asarray(table, dtype=np.float64)
+        self.wrap = wrap
+        self.iteration = 0
+
+        super().__init__(optimizer, -1)
+
+    def get_lr(self):
+        lr = self.lr_at(self.iteration)
+        self.iteration += 1
+
+        return [lr for base_lr in self.base_lrs]
+
+    def lr_table(self, steps):
+        steps = np.asarray(steps)
+
+        if self.wrap:
+            return self.table[steps % len(self.table)]
+
+        return self.table[np.minimum(steps, len(self.table) - 1)]
@@ -0,0 +1,129 @@
+import torch
+import torch.distributed as dist
+from torch.optim import Optimizer
+
+
+def partition(params, world_size):
+    # Greedily assigns the largest parameters to the least loaded rank, so
+    # every rank holds roughly 1 / world_size of the optimizer state
+    loads = [0] * world_size
+    owners = {}
+
+    for p in sorted(params, key=lambda p: p.numel(), reverse=True):
+        rank = loads.index(min(loads))
+        owners[p] = rank
+        loads[rank] += p.numel()
+
+    return owners
+
+
+class ShardedOptimizer(Optimizer):
+    """Shards optimizer state across data parallel ranks (ZeRO stage 1).
+
+    Parameters are partitioned across the ranks of ``process_group`` and each
+    rank builds ``optimizer`` (a factory such as the ones returned by the
+    optimizer registry) only for the parameters it owns. Gradients are
+    expected to be already averaged across ranks, e.g. by
+    DistributedDataParallel. After the local update, every parameter is
+    broadcast from its owner, so all ranks end up with the same weights.
+
+    Hyperparameters of ``param_groups`` (e.g. set by learning rate
+    schedulers) are copied to the local optimizer before every step.
+    ``state_dict`` only contains the state of the local shard, so every rank
+    has to save and load its own.
+    """
+
+    def __init__(self, params, optimizer, process_group=None):
+        self.process_group = process_group
+        self.rank = dist.get_rank(process_group)
+        self.world_size = dist.get_world_size(process_group)
+
+        param_groups = list(params)
+        if len(param_groups) == 0:
+            raise ValueError("optimizer got an empty parameter list")
+
+        if not isinstance(param_groups[0], dict):
+            param_groups = [{'params': param_groups}]
+
+        param_groups = [
+            dict(group, params=list(group['params'])) for group in param_groups
+        ]
+        self.owners = partition(
+            [p for group in param_groups for p in group['params']], self.world_size
+        )
+
+        self.optimizer = optimizer(
+            [
+                dict(
+                    group,
+                    params=[p for p in group['params'] if self.owners[p] == self.rank],
+                )
+                for group in param_groups
+            ]
+        )
+
+        super(ShardedOptimizer, self).__init__(param_groups, self.optimizer.defaults)
+
+        self.state = self.optimizer.state
+
+    def sync_param_groups(self, source, target):
+        for source_group, target_group in zip(source, target):
+            for key, value in source_group.items():
+                if key != 'params':
+                    target_group[key] = value
+
+    def broadcast_params(self):
+        handles = []
+        buffers = []
+
+        for rank in range(self.world_size):
+            src = rank
+            if self.process_group is not None:
+                src = dist.get_global_rank(self.process_group, rank)
+
+            # Parameters are coalesced per owner and dtype, so a step issues
+            # at most world_size * n_dtypes broadcasts
+            params = {}
+            for group in self.param_groups:
+                for p in group['params']:
+                    if self.owners[p] == rank:
+                        params.setdefault(p.dtype, []).append(p)
+
+            for dtype_params in params.values():
+                flat = torch.cat([p.data.reshape(-1) for p in dtype_params])
+                handles.append(
+                    dist.broadcast(flat, src, group=self.process_group, async_op=True)
+                )
+                buffers.append((flat, dtype_params))
+
+        for handle in handles:
+            handle.wait()
+
+        for flat, dtype_params in buffers:
+            for p, value in zip(
+                dtype_params, flat.split([p.numel() for p in dtype_params])
+            ):
+                p.data.copy_(value.view_as(p))
+
+    def step(self, closure=None):
+        self.sync_param_groups(self.param_groups, self.optimizer.param_groups)
+        loss = self.optimizer.step(closure)
+        self.broadcast_params()
+
+        return loss
+
+    def state_dict(self):
+        self.sync_param_groups(self.param_groups, self.optimizer.param_groups)
+
+        return self.optimizer.state_dict()
+
+    def load_state_dict(self, state_dict):
+        self.optimizer.load_state_dict(state_dict)
+        self.sync_param_groups(self.optimizer.param_groups, self.param_groups)
+        self.state = self.optimizer.state
+
+
+def sharded(optimizer, process_group=None):
+    """Wraps an optimizer factory to build a ShardedOptimizer."""
+
+    return lambda parameters: ShardedOptimizer(parameters, optimizer, process_group)
@@ -1,6 +1,65 @@
+from torch.nn.utils import clip_grad_norm_
+
+from .flat import grad_buckets
+
+
 class Updater:
-    def __init__(self, scheduler, optimizer):
+    """Steps the scheduler and the optimizer.
+
+    With ``accumulate=k`` gradients of k micro-batches are accumulated and
+    only every k-th call of ``step`` updates the parameters. ``max_norm``
+    clips the global gradient norm, which is kept on device as
+    ``grad_norm`` so that clipping does not need a host sync. With a
+    ``scaler`` (torch.cuda.amp.GradScaler or torch.amp.GradScaler), steps with
+    non-finite gradients are skipped, and the scheduler does not advance
+    until a step succeeds. Disabled scalers are passed over. Use
+    ``backward`` to scale losses for accumulation and the scaler.
+
+    Gradients are reset with ``optimizer.zero_grad`` after every update, with
+    ``set_to_none`` passed through if given. With ``bucket_size`` gradients
+    are instead kept as views into persistent flat buffers of at most
+    bucket_size elements, which are zeroed with one memset per bucket.
+    Gradients of parameters that backward did not reach are set to None
+    before the update, so the optimizer leaves these parameters unchanged.
+    """
+
+    def __init__(
+        self,
+        scheduler,
+        optimizer,
+        accumulate=1,
+        max_norm=None,
+        norm_type=2.0,
+        scaler=None,
+        set_to_none=None,
+        bucket_size=None,
+    ):
         self.optimizer = optimizer
+        self.accumulate = accumulate
+        self.max_norm = max_norm
+        self.norm_type = norm_type
+        self.scaler = scaler
+        self.set_to_none = set_to_none
+        self.buckets = None
+
+        if bucket_size is not None:
+            if set_to_none:
+                raise ValueError('set_to_none cannot be used with bucket_size')
+
+            self.buckets = grad_buckets(
+                [
+                    p
+                    for group in optimizer.param_groups
+                    for p in group['params']
+                    if p.requires_grad
+                ],
+                bucket_size,
+            )
+
+        self.micro_step = 0
+        self.grad_norm = None
+        self.skipped = False
+        self.scale = None
 
         if scheduler is not None:
             self.scheduler = scheduler(optimizer)
@@ -8,13 +67,82 @@ class Updater:
         else:
             self.scheduler = None
 
+    def backward(self, loss):
+        if self.accumulate > 1:
+            loss = loss / self.accumulate
+
+        if self.scaler is not None:
+            loss = self.scaler.scale(loss)
+
+        loss.backward()
+
+    def params(self):
+        return [
+            p
+            for group in self.optimizer.param_groups
+            for p in group['params']
+            if p.grad is not None
+        ]
+
     def step(self, zero_grad=True):
-        if self.scheduler is not None:
+        """Returns whether the parameters were updated, i.e. False on
+        accumulation micro-steps and on steps skipped by the scaler."""
+
+        self.micro_step += 1
+
+        if self.micro_step % self.accumulate != 0:
+            return False
+
+        if self.buckets is not None:
+            for bucket in self.buckets:
+                bucket.release()
+
+        scaling = self.scaler is not None and self.scaler.is_enabled()
+
+        if scaling:
+            self.scaler.unscale_(self.optimizer)
+
+        if self.max_norm is not None:
+            self.grad_norm = clip_grad_norm_(
+                self.params(), self.max_norm, norm_type=self.norm_type
+            )
+
+        # A skipped step is retried with the learning rate it was given, so
+        # the scheduler only advances after steps that updated the parameters
+        if self.scheduler is not None and not self.skipped:
             self.scheduler.step()
 
-        self.optimizer.step()
+        if scaling:
+            if self.scale is None:
+                self.scale = self.scaler.get_scale()
+
+            self.scaler.step(self.optimizer)
+            self.scaler.update()
+
+            # The scale only decreases if the gradients were not finite, in
+            # which case the scaler skipped the optimizer step. GradScaler.step
+            # syncs on that already, so reading the scale adds no extra sync
+            scale = self.scaler.get_scale()
+            self.skipped = scale < self.scale
+            self.scale = scale
+
+        else:
+            self.optimizer.step()
 
         if zero_grad:
+            self.zero_grad()
+
+        return not self.skipped
+
+    def zero_grad(self):
+        if self.buckets is not None:
+            for bucket in self.buckets:
+                bucket.zero_()
+
+        elif self.set_to_none is not None:
+            self.optimizer.zero_grad(set_to_none=self.set_to_none)
+
+        else:
             self.optimizer.zero_grad()
 
     @property
@@ -4,9 +4,9 @@ from scipy.signal import savgol_filter
 
 
 class Recorder:
-    def __init__(self, seq=[], step=[], decay=0.99):
-        self.data = seq
-        self.step = step
+    def __init__(self, seq=None, step=None, decay=0.99):
+        self.data = [] if seq is None else seq
+        self.step = [] if step is None else step
 
         self.moving_avg_val = None
         self.decay = decay
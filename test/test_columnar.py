@@ -0,0 +1,103 @@
+import numpy as np
+import torch
+from torch.utils.data import DataLoader
+
+from sujip.data import DataFrame, Field, Derived, Row, ColumnarWriter, ColumnarDataset
+
+
+def test_columnar_roundtrip(tmp_path):
+    dset = DataFrame(
+        image=Field(),
+        text=Field(pad=True),
+        patch=Field(pad=True),
+        label=Field(listify=True),
+        name=Field(listify=True),
+        length=Derived(fn=lambda b: len(b.text), listify=True),
+    )
+
+    samples = [
+        Row(
+            image=np.full((2, 2), i, dtype=np.float64),
+            text=list(range(i + 1)),
+            patch=np.ones((i + 1, 2), dtype=np.float32),
+            label=i,
+            name=f'sample {i}',
+        )
+        for i in range(4)
+    ]
+
+    with ColumnarWriter(str(tmp_path), dset) as writer:
+        for sample in samples:
+            writer.write(sample)
+
+    dataset = ColumnarDataset(str(tmp_path))
+
+    assert len(dataset) == 4
+    assert list(dataset[2].keys()) == ['image', 'text', 'patch', 'label', 'name']
+    assert dataset[2].text.tolist() == [0, 1, 2]
+    assert dataset[-1].patch.shape == (4, 2)
+    assert dataset[1].image.dtype == np.float64
+    assert isinstance(dataset[3].image, np.memmap)
+    assert dataset[2].label == 2
+    assert dataset[2].name == 'sample 2'
+
+    collate = dset.collate_fn()(dataset[1:4])
+
+    assert collate.image.dtype == torch.float32
+    assert collate.text.tolist() == [[0, 1, 0, 0], [0, 1, 2, 0], [0, 1, 2, 3]]
+    assert collate.patch.shape == (3, 4, 2)
+    assert collate.length == [2, 3, 4]
+    assert collate.label == [1, 2, 3]
+    assert collate.name == ['sample 1', 'sample 2', 'sample 3']
+
+
+def test_columnar_getitems(tmp_path):
+    dset = DataFrame(
+        image=Field(),
+        text=Field(pad=True, lengths=True),
+        tokens=Field(pack=True),
+        patch=Field(pad=True),
+        score=Field(),
+        label=Field(listify=True),
+        length=Derived(fn=lambda b: len(b.text), listify=True),
+    )
+
+    with ColumnarWriter(str(tmp_path), dset) as writer:
+        for i in range(6):
+            writer.write(
+                Row(
+                    image=np.full((2, 2), i, dtype=np.float64),
+                    text=list(range(i + 1)),
+                    tokens=list(range(i + 1)),
+                    patch=np.ones((i + 1, 2), dtype=np.float32) * i,
+                    score=i / 2,
+                    label=i,
+                )
+            )
+
+    dataset = ColumnarDataset(str(tmp_path))
+    indices = [4, 1, 2]
+
+    columns = dataset.__getitems__(indices)
+    expected = dset.collate_fn()([dataset[i] for i in indices])
+    collate = dset.collate_fn()(columns)
+
+    assert list(collate.keys()) == list(expected.keys())
+
+    for name in ('image', 'text', 'text_lengths', 'tokens', 'patch', 'score'):
+        assert torch.equal(collate[name], expected[name])
+
+    assert collate.tokens_cu_seqlens.tolist() == [0, 5, 7, 10]
+    assert collate.score.tolist() == [[2.0], [0.5], [1.0]]
+    assert collate.label == expected.label == [4, 1, 2]
+    assert collate.length == [5, 2, 3]
+
+    loader = DataLoader(dataset, batch_size=4, collate_fn=dset.collate_fn())
+    batch = next(iter(loader))
+
+    assert batch.text.tolist() == [
+        [0, 0, 0, 0],
+        [0, 1, 0, 0],
+        [0, 1, 2, 0],
+        [0, 1, 2, 3],
+    ]
@@ -1,7 +1,10 @@
 import numpy as np
+import pytest
 import torch
+from torch.utils.data import DataLoader
 
-from sujip.data import DataFrame, Field, Row, Derived
+from sujip.data import DataFrame, Field, Row, Derived, BufferPool
+from sujip.data.dataframe import Columns, collate_pad, collate_pad_1d
 
 
 def test_collate_pad():
@@ -185,3 +188,376 @@ def test_collate_derived_infer():
 
     else:
         assert False
+
+
+def test_collate_plan_reuse():
+    dset = DataFrame(
+        text=Field(pad=True),
+        length=Derived(fn=lambda b: len(b.text)),
+        raw=Field(listify=True),
+    )
+
+    batch = [Row(text=[1, 2], raw='a'), Row(text=[1, 2, 3], raw='b')]
+
+    collate = dset.collate_fn()
+    first = collate(batch)
+    plan = dset.get_plan(batch)
+
+    batch = [Row(text=[4], raw='c'), Row(text=[4, 5, 6, 7], raw='d')]
+    second = collate(batch)
+
+    assert dset.get_plan(batch) is plan
+    assert [step.name for step in plan] == ['text', 'length', 'raw']
+    assert torch.all(first.length == torch.tensor([[2], [3]])).item() == 1
+    assert torch.all(second.text == torch.tensor([[4, 0, 0, 0], [4, 5, 6, 7]])).item()
+    assert second.raw == ['c', 'd']
+
+    uncompiled = dset.collate_fn(compile=False)(batch)
+
+    assert torch.all(uncompiled.text == second.text).item() == 1
+    assert torch.all(uncompiled.length == second.length).item() == 1
+
+
+def test_collate_pad_pool():
+    dset = DataFrame(target=Field(pad=True))
+    pool = BufferPool(depth=1)
+    collate = dset.collate_fn(pool=pool)
+
+    batch = [Row(target=np.array([0.5, 1.5])), Row(target=np.array([1.0, 2, 3]))]
+    first = collate(batch)
+
+    assert first.target.dtype == torch.float32
+    assert torch.allclose(first.target, torch.tensor([[0.5, 1.5, 0], [1, 2, 3]]))
+
+    batch = [Row(target=np.array([4.0])), Row(target=np.array([5.0, 6, 7, 8]))]
+    second = collate(batch)
+
+    assert second.target.data_ptr() == first.target.data_ptr()
+    assert torch.allclose(second.target, torch.tensor([[4.0, 0, 0, 0], [5, 6, 7, 8]]))
+
+
+def test_collate_pad_pool_loader():
+    dset = DataFrame(target=Field(pad=True))
+    samples = [Row(target=np.arange(i % 3 + 1, dtype=np.float32)) for i in range(12)]
+    expected = [
+        torch.tensor([[0.0, 0, 0], [0, 1, 0], [0, 1, 2], [0, 0, 0]]),
+        torch.tensor([[0.0, 1, 0], [0, 1, 2], [0, 0, 0], [0, 1, 0]]),
+        torch.tensor([[0.0, 1, 2], [0, 0, 0], [0, 1, 0], [0, 1, 2]]),
+    ]
+
+    # The consumer holds on to the previous batch while the next one is
+    # collated, which a pool of depth 2 has to keep intact
+    loader = DataLoader(
+        samples, batch_size=4, collate_fn=dset.collate_fn(pool=BufferPool())
+    )
+    previous = None
+
+    for i, batch in enumerate(loader):
+        if previous is not None:
+            assert torch.equal(previous.target, expected[i - 1])
+
+        assert torch.equal(batch.target, expected[i])
+        previous = batch
+
+    loader = DataLoader(
+        samples,
+        batch_size=4,
+        num_workers=1,
+        collate_fn=dset.collate_fn(pool=BufferPool()),
+    )
+
+    with pytest.raises(RuntimeError, match='DataLoader workers'):
+        next(iter(loader))
+
+
+def test_collate_pack():
+    dset = DataFrame(text=Field(pack=True), label=Field())
+
+    batch = [
+        Row(text=[1, 2], label=0),
+        Row(text=[3, 4, 5], label=1),
+        Row(text=[6], label=2),
+    ]
+
+    collate = dset.collate_fn()(batch)
+
+    assert collate.text.tolist() == [1, 2, 3, 4, 5, 6]
+    assert collate.text_cu_seqlens.tolist() == [0, 2, 5, 6]
+    assert collate.text_cu_seqlens.dtype == torch.int32
+    assert collate.text_segment_ids.tolist() == [0, 0, 1, 1, 1, 2]
+
+
+def test_collate_pad_1d():
+    rng = np.random.default_rng(0)
+    arrays = [rng.random(rng.integers(1, 20)) for _ in range(16)]
+    batch = [Row(value=array.tolist()) for array in arrays]
+    dset = DataFrame(value=Field(pad=True))
+
+    collate = dset.collate_fn()(batch)
+    plan = dset.get_plan(batch)
+
+    assert plan[0].collate is collate_pad_1d
+
+    results = {}
+    collate_pad(plan[0], [b.value for b in batch], results)
+
+    assert collate.value.dtype == torch.float32
+    assert torch.equal(collate.value, results['value'])
+
+    # Arrays are padded row by row, which is faster than the scatter for them
+    batch = [Row(value=array) for array in arrays]
+    dset = DataFrame(value=Field(pad=True))
+
+    assert torch.equal(dset.collate_fn()(batch).value, results['value'])
+    assert dset.get_plan(batch)[0].collate is collate_pad
+
+
+def test_collate_pad_scalar():
+    dset = DataFrame(value=Field(pad=True, lengths=True))
+
+    collate = dset.collate_fn()([Row(value=3), Row(value=5)])
+
+    assert collate.value.tolist() == [[3], [5]]
+    assert collate.value_lengths.tolist() == [1, 1]
+
+
+def test_collate_pad_lengths_mask():
+    dset = DataFrame(
+        text=Field(pad=True, pad_value=-1, lengths=True, mask=True),
+        image=Field(pad=True, lengths=True, mask=True),
+    )
+
+    batch = [
+        Row(text=[0, 2], image=np.ones((1, 2))),
+        Row(text=[0, 2, 0], image=np.ones((2, 1))),
+    ]
+
+    collate = dset.collate_fn()(batch)
+
+    assert collate.text.tolist() == [[0, 2, -1], [0, 2, 0]]
+    assert collate.text_lengths.tolist() == [2, 3]
+    assert collate.text_mask.tolist() == [[True, True, False], [True, True, True]]
+    assert collate.image_lengths.tolist() == [[1, 2], [2, 1]]
+    assert collate.image_mask.tolist() == [
+        [[True, True], [False, False]],
+        [[True, False], [True, False]],
+    ]
+    assert torch.equal(collate.image, collate.image_mask.float())
+
+
+def square_sum(b):
+    return float((b.image**2).sum())
+
+
+def test_collate_derived_executor():
+    batch = [Row(image=np.ones((2, 2)) * i) for i in range(10)]
+    expected = [4.0 * i * i for i in range(10)]
+
+    for executor in ('serial', 'thread', 'process'):
+        square = Derived(
+            fn=square_sum, executor=executor, workers=2, chunk_size=3, listify=True
+        )
+        dset = DataFrame(image=Field(), square=square)
+
+        collate = dset.collate_fn()([Row(**b) for b in batch])
+        square.shutdown()
+
+        assert collate.square == expected
+
+    dset = DataFrame(
+        image=Field(),
+        square=Derived(
+            fn=lambda batch: [float((b.image**2).sum()) for b in batch],
+            batched=True,
+            listify=True,
+        ),
+        scaled=Derived(
+            fn=lambda batch, results: [
+                v * results.image.shape[0] for v in (b.square for b in batch)
+            ],
+            need_batch=True,
+            batched=True,
+            listify=True,
+        ),
+    )
+
+    collate = dset.collate_fn()(batch)
+
+    assert collate.square == expected
+    assert collate.scaled == [v * 10 for v in expected]
+
+
+def test_collate_derived_cache(tmp_path):
+    calls = []
+
+    def square(b):
+        calls.append(b.id)
+
+        return b.id**2
+
+    def make_batch():
+        return [Row(id=i) for i in range(4)]
+
+    field = Derived(fn=square, cache=True, cache_size=3, listify=True)
+    dset = DataFrame(id=Field(listify=True), square=field)
+    collate = dset.collate_fn()
+
+    assert collate(make_batch()).square == [0, 1, 4, 9]
+    assert collate(make_batch()).square == [0, 1, 4, 9]
+    assert field.cache.stats()['evictions'] > 0
+    assert len(field.cache.entries) == 3
+
+    field = Derived(
+        fn=square, cache=True, cache_key=lambda b: b.id, cache_dir=str(tmp_path)
+    )
+    dset = DataFrame(id=Field(listify=True), square=field)
+    calls.clear()
+
+    dset.collate_fn()(make_batch())
+    field.cache.clear()
+    collate = dset.collate_fn()(make_batch())
+
+    assert calls == [0, 1, 2, 3]
+    assert collate.square.tolist() == [[0], [1], [4], [9]]
+    assert field.cache.stats()['disk_hits'] == 4
+    assert field.cache.stats()['misses'] == 4
+
+
+def test_collate_derived_cache_epochs():
+    calls = []
+
+    def square(b):
+        calls.append(b.id)
+
+        return b.id**2
+
+    field = Derived(fn=square, cache=True, listify=True)
+    dset = DataFrame(
+        id=Field(listify=True),
+        square=field,
+        cube=Derived(fn=lambda b: b.id**3, listify=True),
+    )
+    collate = dset.collate_fn()
+    batch = [Row(id=i) for i in range(4)]
+
+    for epoch in range(2):
+        assert collate(batch).square == [0, 1, 4, 9]
+
+    assert calls == [0, 1, 2, 3]
+    assert field.cache.stats()['hits'] == 4
+    assert field.cache.stats()['misses'] == 4
+
+
+def test_collate_derived_deps():
+    calls = []
+
+    def track(name, fn):
+        def wrapped(*args):
+            calls.append(name)
+
+            return fn(*args)
+
+        return wrapped
+
+    dset = DataFrame(
+        ratio=Derived(
+            fn=track('ratio', lambda b: b.length / b.total),
+            deps=('length', 'total'),
+            listify=True,
+        ),
+        text=Field(pad=True),
+        length=Derived(fn=track('length', lambda b: len(b.text)), deps=('text',)),
+        total=Derived(
+            fn=track('total', lambda b, batch: int(batch.length.sum())),
+            need_batch=True,
+            deps=('length',),
+            listify=True,
+        ),
+        heavy=Derived(fn=track('heavy', lambda b: sum(b.text)), deps=('text',)),
+    )
+
+    def make_batch():
+        return [Row(text=[1, 2]), Row(text=[1, 2, 3])]
+
+    collate = dset.collate_fn()(make_batch())
+
+    assert list(collate.keys()) == ['ratio', 'text', 'length', 'total', 'heavy']
+    assert collate.ratio == [0.4, 0.6]
+
+    ratio, *_ = collate
+    assert ratio == [0.4, 0.6]
+
+    calls.clear()
+    collate = dset.collate_fn(fields=['ratio'])(make_batch())
+
+    assert list(collate.keys()) == ['ratio']
+    assert 'heavy' not in calls
+    assert collate.ratio == [0.4, 0.6]
+
+    collate = dset.collate_fn(workers=2)(make_batch())
+
+    assert list(collate.keys()) == ['ratio', 'text', 'length', 'total', 'heavy']
+    assert torch.equal(collate.heavy, torch.tensor([[3], [6]]))
+
+    dset = DataFrame(
+        a=Derived(fn=lambda b: 0, deps=('b',)), b=Derived(fn=lambda b: 0, deps=('a',))
+    )
+
+    try:
+        dset.collate_fn()([Row(), Row()])
+
+    except ValueError:
+        pass
+
+    else:
+        assert False
+
+
+def test_collate_profiler():
+    dset = DataFrame(
+        text=Field(pad=True),
+        image=Field(),
+        length=Derived(fn=lambda b: len(b.text), listify=True),
+    )
+    profiler = dset.enable_profiling()
+
+    batch = [
+        Row(text=[1, 2], image=np.ones(3)),
+        Row(text=[1, 2, 3, 4], image=np.ones(3)),
+    ]
+
+    dset.collate_fn()(batch)
+    dset.collate_fn()(batch)
+    report = dset.profile()
+
+    assert list(report.keys()) == ['text', 'image', 'length']
+    assert report['text']['calls'] == 2
+    assert report['text']['padding_ratio'] == 0.25
+    assert report['text']['bytes'] == 2 * 8 * 8
+    assert report['image']['conversions'] == 2
+    assert report['image']['conversion_bytes'] == 2 * 6 * 8
+    assert report['length']['derive_time'] > 0
+
+    recorder = profiler.recorder_set()
+    profiler.record(recorder, step=0)
+
+    assert recorder.recorder['text/calls'].last() == 2
+    assert recorder.recorder['image/calls'].last() == 2
+
+    dset.disable_profiling()
+
+    assert dset.profile() is None
+
+
+def test_collate_profiler_columns():
+    dset = DataFrame(text=Field(pad=True), image=Field())
+    columns = Columns(text=[[1, 2], [1, 2, 3, 4]], image=np.ones((2, 3)))
+
+    expected = dset.collate_fn()(columns)
+    dset.enable_profiling()
+    collate = dset.collate_fn()(columns)
+    report = dset.profile()
+
+    assert torch.equal(collate.text, expected.text)
+    assert report['text']['padding_ratio'] == 0.25
+    assert report['image']['calls'] == 1
@@ -0,0 +1,275 @@
+import copy
+import io
+import os
+
+import pytest
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+
+from sujip.optim import AdamW, LAMB, QHAdam, ShardedOptimizer, Updater, sharded
+
+
+def make_params():
+    torch.manual_seed(0)
+
+    return [
+        torch.nn.Parameter(torch.randn(4, 3)),
+        torch.nn.Parameter(torch.randn(5)),
+        torch.nn.Parameter(torch.randn(2, 2, dtype=torch.float64)),
+        torch.nn.Parameter(torch.randn(3)),
+    ]
+
+
+def run(optim_cls, params, n_steps=5, skip=3, **kwargs):
+    optimizer = optim_cls(params, **kwargs)
+
+    for i in range(n_steps):
+        for j, p in enumerate(params):
+            # Leave one parameter without gradient on some steps so that
+            # parameters end up with different step counts
+            if j == skip and i % 2 == 0:
+                p.grad = None
+
+            else:
+                p.grad = torch.sin(p.detach() * (i + 1) + j)
+
+        optimizer.step()
+
+    return params
+
+
+@pytest.mark.parametrize(
+    'optim_cls, kwargs',
+    [
+        (AdamW, {}),
+        (AdamW, {'weight_decay': 0.1, 'amsgrad': True}),
+        (LAMB, {}),
+        (LAMB, {'weight_decay': 0.01, 'amsgrad': True}),
+        (QHAdam, {}),
+        (QHAdam, {'weight_decay': 0.1, 'nus': (0.7, 0.9)}),
+    ],
+)
+def test_foreach_matches_per_parameter(optim_cls, kwargs):
+    params = make_params()
+    reference = run(optim_cls, copy.deepcopy(params), **kwargs)
+    result = run(optim_cls, params, foreach=True, **kwargs)
+
+    for p, ref in zip(result, reference):
+        assert p.dtype == ref.dtype
+        torch.testing.assert_close(p, ref, rtol=0, atol=1e-6)
+
+
+@pytest.mark.parametrize('foreach', [False, True])
+def test_lamb_trust_ratio(foreach):
+    params = [
+        torch.nn.Parameter(torch.zeros(3)),
+        torch.nn.Parameter(torch.full((4,), 3.0)),
+    ]
+    params[0].grad = torch.ones(3)
+    params[1].grad = torch.full((4,), -2.0)
+
+    LAMB(params, lr=0.1, foreach=foreach).step()
+
+    # The first Adam step is sign(grad), so zero weights fall back to a trust
+    # ratio of 1 and the others are scaled by ||p|| / ||step|| = 3
+    torch.testing.assert_close(params[0], torch.full((3,), -0.1))
+    torch.testing.assert_close(params[1], torch.full((4,), 3.3))
+
+
+@pytest.mark.parametrize(
+    'optim_cls, kwargs',
+    [
+        (AdamW, {'weight_decay': 0.1, 'amsgrad': True}),
+        (LAMB, {'weight_decay': 0.01}),
+        (QHAdam, {'weight_decay': 0.1, 'nus': (0.7, 0.9)}),
+    ],
+)
+def test_flat_matches_per_parameter(optim_cls, kwargs):
+    params = make_params()
+    reference = run(optim_cls, copy.deepcopy(params), **kwargs)
+    result = run(optim_cls, params, flat=True, **kwargs)
+
+    for p, ref in zip(result, reference):
+        assert p.shape == ref.shape and p.dtype == ref.dtype
+        torch.testing.assert_close(p, ref, rtol=0, atol=1e-6)
+
+
+@pytest.mark.parametrize('optim_cls', [AdamW, LAMB, QHAdam])
+def test_flat_frozen(optim_cls):
+    params = make_params()
+    params[1].requires_grad_(False)
+    frozen = params[1].detach().clone()
+
+    optimizer = optim_cls(params, weight_decay=0.5, flat=True)
+
+    for _ in range(2):
+        for p in params:
+            p.grad = torch.ones_like(p) if p.requires_grad else None
+
+        optimizer.step()
+
+    assert torch.equal(params[1], frozen)
+    assert all(params[1] is not p for b in optimizer.flat_buffers[0] for p in b.params)
+
+
+def test_flat_buffers():
+    params = make_params()
+    optimizer = AdamW(params, flat=True)
+
+    for p in params:
+        p.grad = torch.ones_like(p)
+
+    optimizer.step()
+
+    for p in params:
+        p.grad = None
+
+    values = [p.detach().clone() for p in params]
+    optimizer.step()
+
+    # Parameters without gradients are not updated
+    for p, value in zip(params, values):
+        assert torch.equal(p, value)
+
+    float_buffer, double_buffer = optimizer.flat_buffers[0]
+    assert float_buffer.data.numel() == 12 + 5 + 3
+    assert params[0].data_ptr() == float_buffer.data.data_ptr()
+    assert params[2].data_ptr() == double_buffer.data.data_ptr()
+    assert params[1].grad is None
+
+    # Gradients set after a step are copied back into the buffer
+    params[1].grad = torch.ones_like(params[1])
+    optimizer.step()
+    assert params[1].grad.data_ptr() == float_buffer.grad.data_ptr() + 12 * 4
+
+    state = optimizer.state_dict()['state']
+    assert sorted(state) == ['flat_0_0', 'flat_0_1']
+    assert state['flat_0_0']['exp_avg'].shape == (20,)
+
+    restored = AdamW(params, flat=True)
+    restored.load_state_dict(optimizer.state_dict())
+    assert state['flat_0_0']['step'] == [1, 2, 1]
+    assert restored.state['flat_0_1']['step'] == [1]
+
+
+def run_master(optim_cls, dtype, n_steps=20, **kwargs):
+    torch.manual_seed(0)
+    weights = torch.randn(4, 300).bfloat16()
+    grads = torch.randn(n_steps, 4, 300).bfloat16()
+
+    param = torch.nn.Parameter(weights.to(dtype))
+    optimizer = optim_cls([param], lr=1e-2, **kwargs)
+
+    for grad in grads:
+        param.grad = grad.to(dtype)
+        optimizer.step()
+
+    return param, optimizer
+
+
+@pytest.mark.parametrize('optim_cls', [AdamW, LAMB, QHAdam])
+@pytest.mark.parametrize(
+    'state_precision, atol', [(None, 1e-6), ('bf16', 2e-3), ('8bit', 1.5e-2)]
+)
+def test_master_weights(optim_cls, state_precision, atol):
+    reference, _ = run_master(optim_cls, torch.float32, weight_decay=0.01)
+    param, optimizer = run_master(
+        optim_cls,
+        torch.bfloat16,
+        weight_decay=0.01,
+        master_weights=True,
+        state_precision=state_precision,
+    )
+
+    state = optimizer.state[param]
+    assert param.dtype == torch.bfloat16
+    torch.testing.assert_close(state['master'], reference, rtol=0, atol=atol)
+    torch.testing.assert_close(param, state['master'].bfloat16(), rtol=0, atol=0)
+
+    restored = optim_cls([param], master_weights=True, state_precision=state_precision)
+    restored.load_state_dict(optimizer.state_dict())
+    assert restored.state[param]['master'].dtype == torch.float32
+
+
+def test_quantized_state():
+    param, optimizer = run_master(AdamW, torch.float32, state_precision='8bit')
+    state = optimizer.state[param]
+
+    assert 'exp_avg' not in state
+    assert state['exp_avg_codes'].dtype == torch.int8
+    assert state['exp_avg_sq_codes'].dtype == torch.uint8
+    # One byte per element plus an fp32 scale per block of 256
+    assert state['exp_avg_codes'].numel() == 1280
+    assert state['exp_avg_scale'].shape == (5, 1)
+
+    reference, _ = run_master(AdamW, torch.float32)
+    torch.testing.assert_close(param, reference, rtol=0, atol=1e-2)
+
+    buffer = io.BytesIO()
+    torch.save(optimizer.state_dict(), buffer)
+    buffer.seek(0)
+
+    copy_param = torch.nn.Parameter(param.detach().clone())
+    restored = AdamW([copy_param], lr=1e-2, state_precision='8bit')
+    restored.load_state_dict(torch.load(buffer, weights_only=True))
+
+    for key, value in state.items():
+        if torch.is_tensor(value):
+            assert torch.equal(restored.state[copy_param][key], value)
+
+    param.grad = copy_param.grad = torch.ones_like(param)
+    optimizer.step()
+    restored.step()
+
+    torch.testing.assert_close(copy_param, param, rtol=0, atol=0)
+
+
+def run_sharded(rank, world_size, init_file):
+    dist.init_process_group(
+        'gloo', init_method=f'file://{init_file}', rank=rank, world_size=world_size
+    )
+
+    try:
+        params = make_params()
+        reference = run(AdamW, copy.deepcopy(params), skip=None, weight_decay=0.1)
+
+        optimizer = sharded(lambda params: AdamW(params, weight_decay=0.1))(params)
+        assert isinstance(optimizer, ShardedOptimizer)
+
+        updater = Updater(None, optimizer)
+
+        for i in range(5):
+            for j, p in enumerate(params):
+                p.grad = torch.sin(p.detach() * (i + 1) + j)
+
+            updater.step()
+
+        for p, ref in zip(params, reference):
+            torch.testing.assert_close(p, ref, rtol=0, atol=1e-6)
+
+        # Every rank only holds the state of its own parameters
+        owned = [p for p in params if optimizer.owners[p] == rank]
+        assert 0 < len(owned) < len(params)
+        assert set(optimizer.state) == set(owned)
+
+        counts = torch.tensor([len(optimizer.state)])
+        dist.all_reduce(counts)
+        assert counts.item() == len(params)
+
+        restored = ShardedOptimizer(params, AdamW)
+        restored.load_state_dict(optimizer.state_dict())
+        assert restored.param_groups[0]['weight_decay'] == 0.1
+        assert set(restored.state) == set(owned)
+
+    finally:
+        dist.destroy_process_group()
+
+
+def test_sharded_optimizer(tmp_path):
+    world_size = 2
+    mp.spawn(
+        run_sharded,
+        args=(world_size, os.path.join(tmp_path, 'init')),
+        nprocs=world_size,
+    )
@@ -0,0 +1,64 @@
+import time
+
+import torch
+
+from sujip.data import Batch, Prefetcher
+
+
+def make_loader(n):
+    return [Batch(x=torch.full((2,), i)) for i in range(n)]
+
+
+def test_prefetch_order():
+    moved = []
+
+    def transfer(batch):
+        time.sleep(0.01)
+        moved.append(batch.x[0].item())
+
+        return Batch(x=batch.x + 100)
+
+    prefetcher = Prefetcher(make_loader(5), 'cpu', depth=2, transfer=transfer)
+    batches = []
+
+    for batch in prefetcher:
+        batches.append(batch.x[0].item())
+
+    assert batches == [100, 101, 102, 103, 104]
+    assert moved == [0, 1, 2, 3, 4]
+    assert prefetcher.n_batches == 5
+    assert prefetcher.stall_time > 0
+
+
+def test_prefetch_overlap_and_break():
+    transferred = []
+
+    def transfer(batch):
+        transferred.append(batch.x[0].item())
+
+        return batch
+
+    prefetcher = Prefetcher(make_loader(100), 'cpu', depth=3, transfer=transfer)
+
+    for batch in prefetcher:
+        time.sleep(0.05)
+        break
+
+    assert 1 < len(transferred) <= 5
+
+
+def test_prefetch_error():
+    def transfer(batch):
+        raise RuntimeError('transfer failed')
+
+    prefetcher = Prefetcher(make_loader(3), 'cpu', transfer=transfer)
+
+    try:
+        for batch in prefetcher:
+            pass
+
+    except RuntimeError as e:
+        assert str(e) == 'transfer failed'
+
+    else:
+        assert False
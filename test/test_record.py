@@ -0,0 +1,91 @@
+import pickle
+
+import torch
+
+from sujip.data import DataFrame, Field, Derived, Row, RowRecord, BatchRecord
+
+
+def test_row_positional():
+    row = Row(a=1, b=2, c=3)
+
+    assert row[0] == 1
+    assert row[2] == 3
+    assert row[-1] == 3
+
+
+def test_row_record():
+    dset = DataFrame(text=Field(pad=True), label=Field(), length=Derived(fn=len))
+    Sample = dset.row_type()
+
+    row = Sample(text=[1, 2], label=3)
+
+    assert isinstance(row, RowRecord)
+    assert row[0] == [1, 2]
+    assert row['label'] == row.label == 3
+    assert list(row.keys()) == ['text', 'label']
+    assert 'length' not in row
+    assert not hasattr(row, '__dict__')
+
+    row['length'] = 2
+
+    assert row[2] == 2
+    assert pickle.loads(pickle.dumps(row)) == row
+
+    try:
+        row['unknown'] = 1
+
+    except KeyError:
+        pass
+
+    else:
+        assert False
+
+
+def test_collate_records():
+    dset = DataFrame(
+        text=Field(pad=True, lengths=True),
+        label=Field(),
+        length=Derived(fn=lambda b: len(b.text), listify=True),
+    )
+    Sample = dset.row_type()
+    batch = [Sample(text=[1, 2], label=0), Sample(text=[1, 2, 3], label=1)]
+
+    collate = dset.collate_fn(compact=True)(batch)
+
+    assert isinstance(collate, BatchRecord)
+    assert collate._fields == ('text', 'text_lengths', 'label', 'length')
+    assert collate.text.tolist() == [[1, 2, 0], [1, 2, 3]]
+    assert collate.length == [2, 3]
+
+    text, lengths, label, length = collate
+
+    assert torch.equal(lengths, torch.tensor([2, 3]))
+    assert pickle.loads(pickle.dumps(collate)).length == [2, 3]
+
+
+def test_pin_memory_records(monkeypatch):
+    from torch.utils.data._utils.pin_memory import pin_memory
+
+    dset = DataFrame(
+        text=Field(pad=True, lengths=True),
+        label=Field(),
+        length=Derived(fn=lambda b: len(b.text), listify=True),
+    )
+    Sample = dset.row_type()
+    batch = [Sample(text=[1, 2], label=0), Sample(text=[1, 2, 3], label=1)]
+    collate = dset.collate_fn(compact=True)(batch)
+
+    # Pinning needs an accelerator, so it is replaced by a copy
+    monkeypatch.setattr(torch.Tensor, 'pin_memory', lambda self: self.clone())
+
+    pinned = pin_memory(collate)
+
+    assert type(pinned) is type(collate)
+    assert pinned._fields == collate._fields
+    assert pinned.text.tolist() == [[1, 2, 0], [1, 2, 3]]
+    assert pinned.length == [2, 3]
+
+    rebuilt = type(collate)(dict(collate.items()))
+
+    assert rebuilt == collate
+    assert rebuilt.label is collate.label
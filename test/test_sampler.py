@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+from sujip.data import (
+    DataFrame,
+    Field,
+    Row,
+    BucketBatchSampler,
+    TokenBudgetBatchSampler,
+    padding_efficiency,
+)
+
+
+def test_bucket_sampler():
+    lengths = [1, 30, 2, 31, 3, 32, 4, 33]
+    sampler = BucketBatchSampler(lengths, batch_size=2, boundaries=[10])
+
+    batches = list(sampler)
+
+    assert len(batches) == len(sampler) == 4
+    assert sorted(i for batch in batches for i in batch) == list(range(8))
+
+    for batch in batches:
+        assert len(set(lengths[i] < 10 for i in batch)) == 1
+
+    assert sampler.padding_efficiency() > padding_efficiency(
+        np.array(lengths), [[0, 1], [2, 3], [4, 5], [6, 7]]
+    )
+
+
+def test_bucket_sampler_from_dataframe():
+    dset = DataFrame(image=Field(), text=Field(pad=True), label=Field(listify=True))
+    dataset = [
+        Row(image=np.ones(3), text=[1] * length, label=0) for length in (5, 1, 4, 2)
+    ]
+
+    sampler = BucketBatchSampler.from_dataframe(
+        dset, dataset, 2, boundaries=[3], shuffle=False
+    )
+
+    assert list(sampler.lengths) == [5, 1, 4, 2]
+    assert list(sampler) == [[1, 3], [2, 0]]
+    assert sampler.padding_efficiency() == 12 / 14
+
+
+def test_bucket_sampler_empty():
+    with pytest.raises(ValueError, match='empty lengths'):
+        BucketBatchSampler([], batch_size=2)
+
+    assert list(BucketBatchSampler([], batch_size=2, boundaries=[3])) == []
+
+    dset = DataFrame(image=Field(), label=Field(listify=True))
+
+    with pytest.raises(ValueError, match='pad or pack'):
+        dset.lengths([Row(image=np.ones(3), label=0)])
+
+
+def test_token_budget_sampler():
+    rng = np.random.default_rng(0)
+    lengths = rng.integers(1, 64, 500)
+    sampler = TokenBudgetBatchSampler(lengths, max_tokens=256, sort_window=100)
+
+    batches = list(sampler)
+
+    assert len(batches) == len(sampler)
+    assert sorted(i for batch in batches for i in batch) == list(range(500))
+
+    for batch in batches:
+        assert len(batch) * lengths[batch].max() <= 256
+
+    sampler = TokenBudgetBatchSampler([300, 2, 2], max_tokens=256, shuffle=False)
+
+    assert list(sampler) == [[1, 2], [0]]
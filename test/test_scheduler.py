@@ -0,0 +1,90 @@
+import numpy as np
+import pytest
+import torch
+
+from sujip.optim.scheduler import (
+    CosineLR,
+    PowerLR,
+    SineLR,
+    LinearLR,
+    CLR,
+    Warmup,
+    CycleAnnealScheduler,
+    CycleScheduler,
+    LRFinder,
+    TableLR,
+)
+
+
+def make_optimizer():
+    return torch.optim.SGD([torch.nn.Parameter(torch.zeros(1))], lr=1, momentum=0.9)
+
+
+TORCH_SCHEDULERS = [
+    lambda optimizer: CosineLR(optimizer, 0.01, 0.1, 7),
+    lambda optimizer: PowerLR(optimizer, 0.01, 0.1, 5),
+    lambda optimizer: SineLR(optimizer, 0.01, 0.1, 7),
+    lambda optimizer: LinearLR(optimizer, 0.01, 0.1, 3, 8),
+    lambda optimizer: CLR(optimizer, 0.01, 0.1, 4),
+    lambda optimizer: Warmup(optimizer, 512, warmup=6),
+    lambda optimizer: LRFinder(optimizer, 1e-5, 1, 20),
+    lambda optimizer: LRFinder(optimizer, 1e-5, 1, 20, linear=True),
+]
+
+
+@pytest.mark.parametrize('scheduler', TORCH_SCHEDULERS)
+def test_lr_table_torch_schedulers(scheduler):
+    optimizer = make_optimizer()
+    scheduler = scheduler(optimizer)
+    table = scheduler.lr_table(np.arange(30))
+
+    lrs = [optimizer.param_groups[0]['lr']]
+    for _ in range(29):
+        optimizer.step()
+        scheduler.step()
+        lrs.append(optimizer.param_groups[0]['lr'])
+
+    np.testing.assert_allclose(table, lrs, rtol=1e-12)
+    assert scheduler.lr_at(17) == pytest.approx(lrs[17], rel=1e-12)
+
+
+@pytest.mark.parametrize(
+    'scheduler',
+    [
+        lambda optimizer: CycleAnnealScheduler(optimizer, 0.1, 10, 10, 20),
+        lambda optimizer: CycleScheduler(optimizer, 0.1, 12),
+        lambda optimizer: CycleScheduler(
+            optimizer, 0.1, 10, warmup_proportion=0.4, phase=('cos', 'linear')
+        ),
+    ],
+)
+def test_lr_table_cycle_schedulers(scheduler):
+    optimizer = make_optimizer()
+    scheduler = scheduler(optimizer)
+    table = scheduler.lr_table(np.arange(50))
+
+    lrs = []
+    for _ in range(50):
+        scheduler.step()
+        lrs.append(optimizer.param_groups[0]['lr'])
+
+    np.testing.assert_allclose(table, lrs, rtol=1e-12)
+
+
+def test_table_lr():
+    optimizer = make_optimizer()
+    table = CosineLR(optimizer, 0.01, 0.1, 7).lr_table(np.arange(10))
+
+    optimizer = make_optimizer()
+    scheduler = TableLR(optimizer, table)
+
+    lrs = [optimizer.param_groups[0]['lr']]
+    for _ in range(11):
+        optimizer.step()
+        scheduler.step()
+        lrs.append(optimizer.param_groups[0]['lr'])
+
+    np.testing.assert_allclose(lrs, list(table) + [table[-1]] * 2)
+    np.testing.assert_allclose(
+        TableLR(make_optimizer(), table, wrap=True).lr_table([3, 13]), table[[3, 3]]
+    )
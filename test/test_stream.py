@@ -0,0 +1,104 @@
+from sujip.data import DataFrame, Field, Row, ShardedStream
+
+
+def read_shard(shard):
+    for i in range(shard * 10, shard * 10 + 10):
+        yield Row(id=i, text=[i] * (i % 3 + 1))
+
+
+def make_stream(**kwargs):
+    dset = DataFrame(id=Field(listify=True), text=Field(pad=True))
+
+    return ShardedStream(
+        range(6), read_shard, dset, batch_size=4, shuffle_buffer=8, **kwargs
+    )
+
+
+def collect(stream, num_workers=0):
+    loader = stream.loader(num_workers=num_workers)
+
+    return [batch.id for batch in stream.track(loader)]
+
+
+def test_stream_sharding():
+    batches = collect(make_stream())
+    ids = [i for batch in batches for i in batch]
+
+    assert sorted(ids) == list(range(60))
+    assert ids != list(range(60))
+    assert collect(make_stream()) == batches
+
+    ranks = [collect(make_stream(rank=r, world_size=2)) for r in range(2)]
+    ids = [i for batches in ranks for batch in batches for i in batch]
+
+    assert sorted(ids) == list(range(60))
+
+    ids = [i for batch in collect(make_stream(), num_workers=2) for i in batch]
+
+    assert sorted(ids) == list(range(60))
+
+
+def test_stream_resume():
+    for num_workers in (0, 2):
+        full = collect(make_stream(seed=1), num_workers)
+
+        stream = make_stream(seed=1)
+        loader = stream.loader(num_workers=num_workers)
+
+        for step, batch in enumerate(stream.track(loader)):
+            if step == 4:
+                break
+
+        state = stream.state_dict()
+
+        assert state['consumed'] == 5
+
+        resumed = make_stream(seed=1)
+        resumed.load_state_dict(state)
+
+        assert full[5:] == collect(resumed, num_workers)
+
+
+def read_uneven_shard(shard):
+    for i in range(shard * 100, shard * 100 + 2 + shard * 3):
+        yield Row(id=i, text=[i])
+
+
+def make_uneven_stream(seed):
+    dset = DataFrame(id=Field(listify=True), text=Field(pad=True))
+
+    return ShardedStream(
+        range(5), read_uneven_shard, dset, batch_size=4, shuffle_buffer=4, seed=seed
+    )
+
+
+def test_stream_resume_uneven_workers():
+    # Shards of different sizes make one worker run out before the other, so
+    # the loader stops alternating between them
+    for seed in range(3):
+        full = collect(make_uneven_stream(seed), num_workers=2)
+
+        for consumed in range(len(full) - 3, len(full)):
+            stream = make_uneven_stream(seed)
+            loader = stream.loader(num_workers=2)
+
+            for step, batch in enumerate(stream.track(loader)):
+                if step == consumed - 1:
+                    break
+
+            resumed = make_uneven_stream(seed)
+            resumed.load_state_dict(stream.state_dict())
+
+            assert collect(resumed, num_workers=2) == full[consumed:]
+
+
+def test_stream_reuse():
+    stream = make_stream()
+    loader = stream.loader()
+
+    first = [batch.id for batch in stream.track(loader)]
+    second = [batch.id for batch in stream.track(loader)]
+
+    assert len(first) == 15
+    assert second == first
+    assert stream.state_dict()['consumed'] == 0
@@ -0,0 +1,62 @@
+import numpy as np
+import torch
+from torch.utils.data import DataLoader
+
+from sujip.data import DataFrame, Field, Row, SharedMemoryTransport
+
+
+def make_dataset(n):
+    return [
+        Row(image=np.full((4, 4), i, dtype=np.float32), text=[i] * (i % 3 + 1), id=i)
+        for i in range(n)
+    ]
+
+
+def test_transport_roundtrip():
+    dset = DataFrame(image=Field(), text=Field(pad=True), id=Field(listify=True))
+    transport = SharedMemoryTransport(1024, n_slots=2)
+    collate = transport.collate_fn(dset.collate_fn())
+
+    loader = DataLoader(make_dataset(8), batch_size=4, collate_fn=collate)
+    batches = []
+
+    for batch in transport.wrap(loader):
+        assert list(batch.keys()) == ['image', 'text', 'id']
+        assert batch.image.untyped_storage().data_ptr() == (
+            transport.slabs.untyped_storage().data_ptr()
+        )
+        batches.append((batch.image.clone(), batch.text.clone(), batch.id))
+
+    assert batches[1][0][:, 0, 0].tolist() == [4, 5, 6, 7]
+    assert batches[1][1].tolist() == [[4, 4, 0], [5, 5, 5], [6, 0, 0], [7, 7, 0]]
+    assert batches[1][2] == [4, 5, 6, 7]
+    assert transport.busy.sum().item() == 0
+
+
+def test_transport_workers():
+    dset = DataFrame(image=Field(), text=Field(pad=True), id=Field(listify=True))
+    transport = SharedMemoryTransport(1024, n_slots=3, num_workers=2)
+    collate = transport.collate_fn(dset.collate_fn())
+
+    loader = DataLoader(
+        make_dataset(32), batch_size=2, collate_fn=collate, num_workers=2
+    )
+    ids = []
+
+    for batch in transport.wrap(loader):
+        assert torch.all(batch.image[:, 0, 0] == torch.tensor(batch.id)).item()
+        ids.extend(batch.id)
+
+    assert ids == list(range(32))
+
+
+def test_transport_fallback():
+    transport = SharedMemoryTransport(16, n_slots=1)
+    dset = DataFrame(image=Field())
+    batch = transport.collate_fn(dset.collate_fn())(make_dataset(2))
+
+    assert torch.equal(
+        transport.receive(batch).image,
+        torch.ones(2, 4, 4) * torch.arange(2).view(2, 1, 1),
+    )
+    assert transport.busy.sum().item() == 0
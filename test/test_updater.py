@@ -0,0 +1,217 @@
+import copy
+
+import pytest
+import torch
+
+from sujip.optim import Updater
+from sujip.optim.scheduler import CosineLR
+
+
+def make_model():
+    torch.manual_seed(0)
+
+    return torch.nn.Linear(4, 2)
+
+
+def make_updater(model, **kwargs):
+    optimizer = torch.optim.SGD(model.parameters(), lr=0.1)
+    scheduler = lambda optimizer: CosineLR(optimizer, 0.01, 0.1, 10)
+
+    return Updater(scheduler, optimizer, **kwargs)
+
+
+def test_accumulate():
+    model = make_model()
+    reference = copy.deepcopy(model)
+    inputs = torch.randn(8, 4)
+
+    updater = make_updater(reference)
+    updater.backward(reference(inputs).pow(2).mean())
+    assert updater.step()
+
+    updater = make_updater(model, accumulate=2)
+
+    for chunk in inputs.chunk(2):
+        updater.backward(model(chunk).pow(2).mean())
+        stepped = updater.step()
+
+    assert stepped
+    assert updater.micro_step == 2
+    assert updater.scheduler.last_epoch == 1
+
+    for p, ref in zip(model.parameters(), reference.parameters()):
+        torch.testing.assert_close(p, ref)
+        assert p.grad is None or not p.grad.any()
+
+
+def test_accumulate_micro_step():
+    model = make_model()
+    before = copy.deepcopy(model.state_dict())
+    updater = make_updater(model, accumulate=2)
+
+    updater.backward(model(torch.randn(2, 4)).sum())
+
+    assert not updater.step()
+    assert updater.scheduler.last_epoch == 0
+    assert model.weight.grad is not None
+    torch.testing.assert_close(model.state_dict(), before)
+
+
+def test_clip_grad_norm():
+    model = make_model()
+    updater = make_updater(model, max_norm=0.5)
+
+    for p in model.parameters():
+        p.grad = torch.full_like(p, 2.0)
+
+    norm = (sum(p.numel() for p in model.parameters()) * 4.0) ** 0.5
+    updater.step(zero_grad=False)
+
+    assert torch.is_tensor(updater.grad_norm)
+    torch.testing.assert_close(updater.grad_norm, torch.tensor(norm))
+
+    clipped = torch.cat([p.grad.flatten() for p in model.parameters()]).norm()
+    torch.testing.assert_close(clipped, torch.tensor(0.5), rtol=1e-4, atol=1e-4)
+
+
+def test_scaler_skips_non_finite():
+    model = make_model()
+    scaler = torch.amp.GradScaler('cpu', init_scale=4.0)
+    updater = make_updater(model, scaler=scaler, max_norm=1.0)
+
+    updater.backward(model(torch.randn(2, 4)).sum())
+    assert updater.step()
+    assert updater.scheduler.last_epoch == 1
+
+    before = copy.deepcopy(model.state_dict())
+    updater.backward(model(torch.randn(2, 4)).sum() * float('inf'))
+
+    assert not updater.step()
+    assert updater.skipped
+    assert scaler.get_scale() == 2.0
+    torch.testing.assert_close(model.state_dict(), before)
+
+    # The retry uses the learning rate of the skipped step
+    lr = updater.lr
+    updater.backward(model(torch.randn(2, 4)).sum())
+
+    assert updater.step()
+    assert updater.scheduler.last_epoch == 2
+    assert updater.lr == lr
+
+
+def test_disabled_scaler():
+    model = make_model()
+    reference = copy.deepcopy(model)
+    inputs = torch.randn(2, 4)
+
+    updater = make_updater(
+        model, scaler=torch.amp.GradScaler('cpu', enabled=False), max_norm=1.0
+    )
+    reference_updater = make_updater(reference, max_norm=1.0)
+
+    for _ in range(2):
+        updater.backward(model(inputs).sum())
+        assert updater.step()
+
+        reference_updater.backward(reference(inputs).sum())
+        reference_updater.step()
+
+    assert updater.scheduler.last_epoch == 2
+
+    for p, ref in zip(model.parameters(), reference.parameters()):
+        torch.testing.assert_close(p, ref)
+
+
+@pytest.mark.parametrize('accumulate', [1, 3])
+def test_backward_scales_loss(accumulate):
+    model = make_model()
+    scaler = torch.amp.GradScaler('cpu', init_scale=8.0)
+    updater = make_updater(model, scaler=scaler, accumulate=accumulate)
+
+    inputs = torch.randn(2, 4)
+    updater.backward(model(inputs).sum())
+    grad = model.weight.grad.clone()
+
+    model.zero_grad()
+    model(inputs).sum().backward()
+
+    torch.testing.assert_close(grad, model.weight.grad * 8.0 / accumulate)
+
+
+def test_set_to_none():
+    model = make_model()
+    updater = make_updater(model, set_to_none=True)
+
+    updater.backward(model(torch.randn(2, 4)).sum())
+    updater.step()
+
+    assert all(p.grad is None for p in model.parameters())
+
+
+def test_grad_buckets():
+    model = make_model()
+    reference = copy.deepcopy(model)
+    inputs = torch.randn(3, 8, 4)
+
+    updater = make_updater(model, bucket_size=8, accumulate=3)
+    reference_updater = make_updater(reference, accumulate=3)
+
+    # weight (8 elements) and bias (2 elements) do not fit one bucket
+    assert [bucket.grad.numel() for bucket in updater.buckets] == [8, 2]
+
+    ptrs = [p.grad.data_ptr() for p in model.parameters()]
+
+    for _ in range(2):
+        for batch in inputs:
+            updater.backward(model(batch).pow(2).mean())
+            updater.step()
+
+            reference_updater.backward(reference(batch).pow(2).mean())
+            reference_updater.step()
+
+    assert [p.grad.data_ptr() for p in model.parameters()] == ptrs
+    assert not any(bucket.grad.any() for bucket in updater.buckets)
+
+    for p, ref in zip(model.parameters(), reference.parameters()):
+        torch.testing.assert_close(p, ref)
+
+    # Gradients dropped by the optimizer are pointed back to the buckets
+    updater.optimizer.zero_grad(set_to_none=True)
+    updater.zero_grad()
+
+    assert [p.grad.data_ptr() for p in model.parameters()] == ptrs
+
+    with pytest.raises(ValueError):
+        make_updater(model, bucket_size=8, set_to_none=True)
+
+
+def test_grad_buckets_unused():
+    torch.manual_seed(0)
+    model = torch.nn.ModuleDict(
+        {'used': torch.nn.Linear(4, 2), 'unused': torch.nn.Linear(4, 2)}
+    )
+    unused = copy.deepcopy(model['unused'].state_dict())
+    optimizer = torch.optim.AdamW(model.parameters(), lr=0.1, weight_decay=0.1)
+    updater = Updater(None, optimizer, bucket_size=64)
+
+    assert len(updater.buckets) == 1
+
+    for _ in range(2):
+        updater.backward(model['used'](torch.randn(8, 4)).pow(2).mean())
+        assert updater.step()
+
+    for key, value in model['unused'].state_dict().items():
+        assert torch.equal(value, unused[key])
+
+    assert not any(optimizer.state[p] for p in model['unused'].parameters())
+
+    # Gradients are bound to the buckets again for the next backward
+    ptrs = [p.grad.data_ptr() for p in model['used'].parameters()]
+    updater.backward(model['unused'](torch.randn(8, 4)).pow(2).mean())
+    assert updater.step()
+
+    for key, value in model['unused'].state_dict().items():
+        assert not torch.equal(value, unused[key])
+
+    assert [p.grad.data_ptr() for p in model['used'].parameters()] == ptrs